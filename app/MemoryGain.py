@@ -21,6 +21,8 @@ from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt
 import sys
+import datetime
+import csv
 from subprocess import PIPE, Popen
 import cards
 import decks
@@ -28,6 +30,9 @@ import stats
 import settings
 import backups
 import update
+import study
+import review_log
+import forecast
 
 
 # Due to the way python encodes characters all user-entered text, that is going to be written to file, needs to comprise
@@ -397,6 +402,27 @@ class MainWindow(QMainWindow):
         horizontal_line_2.setFrameShape(QtWidgets.QFrame.HLine)
         horizontal_line_2.setFrameShadow(QtWidgets.QFrame.Sunken)
         self.main_frame_grid_layout.addWidget(horizontal_line_2, 3, 0, 1, 3)
+        self.check_near_duplicates_label = QtWidgets.QLabel()
+        self.check_near_duplicates_label.setObjectName('check_near_duplicates_label')
+        self.check_near_duplicates_label.setStyleSheet('''
+                                                        #check_near_duplicates_label{
+                                                            color: white;
+                                                        }
+        ''')
+        self.check_near_duplicates_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.check_near_duplicates_label.setText('Check for similar questions:')
+        self.main_frame_grid_layout.addWidget(self.check_near_duplicates_label, 4, 0, 1, 1)
+
+        self.check_near_duplicates_check_box = QtWidgets.QCheckBox()
+        self.check_near_duplicates_check_box.setObjectName('check_near_duplicates_check_box')
+        self.check_near_duplicates_check_box.setChecked(settings.get_check_near_duplicates())
+        self.check_near_duplicates_check_box.stateChanged.connect(self.check_near_duplicates_changed)
+        self.main_frame_grid_layout.addWidget(self.check_near_duplicates_check_box, 4, 2, 1, 1)
+
+        horizontal_line_3 = QtWidgets.QFrame(self.central_widget)
+        horizontal_line_3.setFrameShape(QtWidgets.QFrame.HLine)
+        horizontal_line_3.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.main_frame_grid_layout.addWidget(horizontal_line_3, 5, 0, 1, 3)
 
         self.create_backup_label = QtWidgets.QLabel()
         self.create_backup_label.setObjectName('create_backup_label')
@@ -407,7 +433,7 @@ class MainWindow(QMainWindow):
                 ''')
         self.create_backup_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
         self.create_backup_label.setText('Create backup:')
-        self.main_frame_grid_layout.addWidget(self.create_backup_label, 4, 0, 1, 1)
+        self.main_frame_grid_layout.addWidget(self.create_backup_label, 6, 0, 1, 1)
 
         self.create_backup_btn = QtWidgets.QPushButton()
         self.create_backup_btn.setObjectName('create_backup_btn')
@@ -419,7 +445,7 @@ class MainWindow(QMainWindow):
         self.create_backup_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
         self.create_backup_btn.setText('Backup')
         self.create_backup_btn.clicked.connect(self.create_backup_btn_clicked)
-        self.main_frame_grid_layout.addWidget(self.create_backup_btn, 4, 2, 1, 1)
+        self.main_frame_grid_layout.addWidget(self.create_backup_btn, 6, 2, 1, 1)
 
         self.backup_list_widget = QtWidgets.QListWidget()
         self.backup_list_widget.setObjectName('backup_list_widget')
@@ -434,7 +460,7 @@ class MainWindow(QMainWindow):
         backup_names = backups.get_backup_names()
         for name in backup_names:
             self.backup_list_widget.addItem(name)
-        self.main_frame_grid_layout.addWidget(self.backup_list_widget, 5, 0, 2, 2)
+        self.main_frame_grid_layout.addWidget(self.backup_list_widget, 7, 0, 2, 2)
 
         self.del_backup_btn = QtWidgets.QPushButton()
         self.del_backup_btn.setObjectName('del_backup_btn')
@@ -446,7 +472,7 @@ class MainWindow(QMainWindow):
         self.del_backup_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
         self.del_backup_btn.setText('Delete')
         self.del_backup_btn.clicked.connect(self.del_backup_btn_clicked)
-        self.main_frame_grid_layout.addWidget(self.del_backup_btn, 5, 2, 1, 1)
+        self.main_frame_grid_layout.addWidget(self.del_backup_btn, 7, 2, 1, 1)
 
         self.restore_backup_btn = QtWidgets.QPushButton()
         self.restore_backup_btn.setObjectName('restore_backup_btn')
@@ -458,10 +484,10 @@ class MainWindow(QMainWindow):
         self.restore_backup_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
         self.restore_backup_btn.setText('Restore')
         self.restore_backup_btn.clicked.connect(self.restore_backup_btn_clicked)
-        self.main_frame_grid_layout.addWidget(self.restore_backup_btn, 6, 2, 1, 1)
+        self.main_frame_grid_layout.addWidget(self.restore_backup_btn, 8, 2, 1, 1)
 
         settings_lower_spacer = QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.main_frame_grid_layout.addItem(settings_lower_spacer, 7, 0, 1, 3)
+        self.main_frame_grid_layout.addItem(settings_lower_spacer, 9, 0, 1, 3)
 
     def restore_backup_btn_clicked(self):
         # Returns if nothing selected.
@@ -563,6 +589,11 @@ class MainWindow(QMainWindow):
     def target_retention_changed(self):
         settings.set_target_retention_rate(self.target_retention_rate_selector.value())
 
+    def check_near_duplicates_changed(self):
+        settings.set_check_near_duplicates(self.check_near_duplicates_check_box.isChecked())
+        # Built in the background, so it is ready by the time a card is added.
+        cards.start_near_duplicate_index()
+
     def font_size_changed(self):
         settings.set_font_size(self.font_size_selector.value())
 
@@ -594,7 +625,7 @@ class MainWindow(QMainWindow):
                                                     }
         ''')
         self.stats_total_cards_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
-        self.stats_total_cards_label.setText(f'Total number of cards: {len(cards.search_for_cards(""))}')
+        self.stats_total_cards_label.setText(f'Total number of cards: {cards.search_cards("").count()}')
         self.stats_total_cards_label.setMinimumHeight(60)
         self.main_frame_grid_layout.addWidget(self.stats_total_cards_label, 0, 0, 1, 1)
 
@@ -628,8 +659,95 @@ class MainWindow(QMainWindow):
         self.stats_retention_30_label.setMinimumHeight(60)
         self.main_frame_grid_layout.addWidget(self.stats_retention_30_label, 2, 0, 1, 1)
 
+        due_forecast = forecast.get_totals(forecast.get_due_forecast(7), 7)
+        self.stats_forecast_label = QtWidgets.QLabel()
+        self.stats_forecast_label.setObjectName('stats_forecast_label')
+        self.stats_forecast_label.setStyleSheet('''
+                                                #stats_forecast_label{
+                                                    color: white;
+                                                }
+        ''')
+        self.stats_forecast_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.stats_forecast_label.setText(f'Cards due (next 7 days): {", ".join(str(count) for count in due_forecast)}')
+        self.stats_forecast_label.setMinimumHeight(60)
+        self.main_frame_grid_layout.addWidget(self.stats_forecast_label, 3, 0, 1, 1)
+
+        projected_reviews = forecast.get_totals(forecast.get_projected_reviews(30), 30)
+        self.stats_projection_label = QtWidgets.QLabel()
+        self.stats_projection_label.setObjectName('stats_projection_label')
+        self.stats_projection_label.setStyleSheet('''
+                                                  #stats_projection_label{
+                                                      color: white;
+                                                  }
+        ''')
+        self.stats_projection_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.stats_projection_label.setText(f'Projected reviews (next 30 days): {sum(projected_reviews)} '
+                                            f'(busiest day: {max(projected_reviews)})')
+        self.stats_projection_label.setMinimumHeight(60)
+        self.main_frame_grid_layout.addWidget(self.stats_projection_label, 4, 0, 1, 1)
+
+        # One pass over the review log, grouped by deck and then by phase. Unlike the retention rates above (which only
+        # count cards with an interval of at least a day), every answer is counted, as otherwise the again phases
+        # would never appear, so the labels say "all answers".
+        grouped_results = stats.get_grouped_results(stats.get_window_start(30))
+        deck_retention_table = stats.group_retention(grouped_results, ('deck',))
+        phase_retention_table = stats.group_retention(grouped_results, ('phase',))
+
+        # Answers to cards that have since been deleted have no deck, so are left out.
+        deck_retention = [f'{deck}: {round(retention)}%' if type(retention) == float else f'{deck}: N/A'
+                          for (deck,), retention in sorted(deck_retention_table.items(),
+                                                           key=lambda item: str(item[0][0])) if deck is not None]
+        self.stats_deck_retention_label = QtWidgets.QLabel()
+        self.stats_deck_retention_label.setObjectName('stats_deck_retention_label')
+        self.stats_deck_retention_label.setStyleSheet('''
+                                                      #stats_deck_retention_label{
+                                                          color: white;
+                                                      }
+        ''')
+        self.stats_deck_retention_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.stats_deck_retention_label.setWordWrap(True)
+        self.stats_deck_retention_label.setText(f'Retention rate by deck (all answers, previous 30 days): '
+                                                f'{", ".join(deck_retention) if deck_retention else "N/A"}')
+        self.stats_deck_retention_label.setMinimumHeight(60)
+        self.main_frame_grid_layout.addWidget(self.stats_deck_retention_label, 5, 0, 1, 1)
+
+        phase_retention = [f'{phase}: {round(retention)}%' if type(retention) == float else f'{phase}: N/A'
+                           for (phase,), retention in sorted(phase_retention_table.items(),
+                                                             key=lambda item: str(item[0][0])) if phase is not None]
+        self.stats_phase_retention_label = QtWidgets.QLabel()
+        self.stats_phase_retention_label.setObjectName('stats_phase_retention_label')
+        self.stats_phase_retention_label.setStyleSheet('''
+                                                       #stats_phase_retention_label{
+                                                           color: white;
+                                                       }
+        ''')
+        self.stats_phase_retention_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.stats_phase_retention_label.setWordWrap(True)
+        self.stats_phase_retention_label.setText(f'Retention rate by phase (all answers, previous 30 days): '
+                                                 f'{", ".join(phase_retention) if phase_retention else "N/A"}')
+        self.stats_phase_retention_label.setMinimumHeight(60)
+        self.main_frame_grid_layout.addWidget(self.stats_phase_retention_label, 6, 0, 1, 1)
+
+        today = datetime.date.today()
+        monthly_retention = [f'{start.strftime("%b %Y")}: {round(retention)}%' for start, retention in
+                             stats.get_retention_series('month', today.replace(year=today.year - 1, day=1), today)
+                             if type(retention) == float]
+        self.stats_monthly_retention_label = QtWidgets.QLabel()
+        self.stats_monthly_retention_label.setObjectName('stats_monthly_retention_label')
+        self.stats_monthly_retention_label.setStyleSheet('''
+                                                         #stats_monthly_retention_label{
+                                                             color: white;
+                                                         }
+        ''')
+        self.stats_monthly_retention_label.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.stats_monthly_retention_label.setWordWrap(True)
+        self.stats_monthly_retention_label.setText(f'Retention rate by month (previous year): '
+                                                   f'{", ".join(monthly_retention) if monthly_retention else "N/A"}')
+        self.stats_monthly_retention_label.setMinimumHeight(60)
+        self.main_frame_grid_layout.addWidget(self.stats_monthly_retention_label, 7, 0, 1, 1)
+
         stats_lower_spacer = QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.main_frame_grid_layout.addItem(stats_lower_spacer, 3, 0, 1, 1)
+        self.main_frame_grid_layout.addItem(stats_lower_spacer, 8, 0, 1, 1)
 
     def menu_search_btn_clicked(self):
         self.search_up_to = 0
@@ -666,7 +784,17 @@ class MainWindow(QMainWindow):
         self.main_frame_grid_layout.addItem(search_lower_right_spacer, 1, 1, 1, 1)
 
     def search_btn_clicked(self, query):
-        if len(cards.search_for_cards(query)) == 0:
+        try:
+            search_cursor = cards.search_cards(query)
+        except ValueError as error:
+            invalid_query_msg = QMessageBox()
+            invalid_query_msg.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+            invalid_query_msg.setWindowTitle('Invalid search')
+            invalid_query_msg.setText(str(error))
+            invalid_query_msg.exec_()
+            return
+
+        if not search_cursor.exists():
             query_not_found_msg = QMessageBox()
             query_not_found_msg.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
             query_not_found_msg.setWindowTitle('Query not found')
@@ -674,7 +802,8 @@ class MainWindow(QMainWindow):
             query_not_found_msg.exec_()
         else:
             self.search_up_to = 0
-            self.searched_cards = cards.search_for_cards(query)
+            # Cards are fetched from the cursor a page at a time, as the user moves through them.
+            self.search_cursor = search_cursor
 
             self.clear_layout(self.main_frame_grid_layout)
 
@@ -722,7 +851,7 @@ class MainWindow(QMainWindow):
             deck_names = decks.get_deck_lines()
             for deck in deck_names:
                 self.search_deck_selector.addItem(deck)
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
             self.search_deck_selector.currentTextChanged.connect(self.search_save)
             self.main_frame_grid_layout.addWidget(self.search_deck_selector, 1, 0, 1, 2)
 
@@ -736,7 +865,7 @@ class MainWindow(QMainWindow):
                                                 }
             ''')
             self.search_qst_text.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
-            self.search_qst_text.setPlainText(self.searched_cards[self.search_up_to]['Question'])
+            self.search_qst_text.setPlainText(self.search_cursor.get(self.search_up_to).question)
             self.search_qst_text.setTabChangesFocus(True)
             self.search_qst_text.textChanged.connect(self.search_save)
             self.main_frame_grid_layout.addWidget(self.search_qst_text, 2, 0, 1, 2)
@@ -751,7 +880,7 @@ class MainWindow(QMainWindow):
                                                             }
                         ''')
             self.search_ans_text.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
-            self.search_ans_text.setPlainText(self.searched_cards[self.search_up_to]['Answer'])
+            self.search_ans_text.setPlainText(self.search_cursor.get(self.search_up_to).answer)
             self.search_ans_text.setTabChangesFocus(True)
             self.search_ans_text.textChanged.connect(self.search_save)
             self.main_frame_grid_layout.addWidget(self.search_ans_text, 3, 0, 1, 2)
@@ -772,8 +901,20 @@ class MainWindow(QMainWindow):
             self.search_del_btn.clicked.connect(self.search_del_btn_clicked)
             self.search_lower_frame_grid_layout.addWidget(self.search_del_btn, 0, 0, 1, 1)
 
+            self.search_del_all_btn = QtWidgets.QPushButton()
+            self.search_del_all_btn.setObjectName('search_del_all_btn')
+            self.search_del_all_btn.setStyleSheet('''
+                                                #search_del_all_btn{
+                                                    color: white;
+                                                }
+            ''')
+            self.search_del_all_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+            self.search_del_all_btn.setText('Delete All')
+            self.search_del_all_btn.clicked.connect(self.search_del_all_btn_clicked)
+            self.search_lower_frame_grid_layout.addWidget(self.search_del_all_btn, 0, 1, 1, 1)
+
             search_lower_frame_center_spacer = QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
-            self.search_lower_frame_grid_layout.addItem(search_lower_frame_center_spacer, 0, 1, 1, 1)
+            self.search_lower_frame_grid_layout.addItem(search_lower_frame_center_spacer, 0, 2, 1, 1)
 
             self.search_previous_btn = QtWidgets.QPushButton()
             self.search_previous_btn.setObjectName('search_previous_btn')
@@ -785,7 +926,7 @@ class MainWindow(QMainWindow):
             self.search_previous_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
             self.search_previous_btn.setText('<')
             self.search_previous_btn.clicked.connect(self.search_previous_btn_clicked)
-            self.search_lower_frame_grid_layout.addWidget(self.search_previous_btn, 0, 2, 1, 1)
+            self.search_lower_frame_grid_layout.addWidget(self.search_previous_btn, 0, 3, 1, 1)
 
             self.search_next_btn = QtWidgets.QPushButton()
             self.search_next_btn.setObjectName('search_next_btn')
@@ -797,7 +938,7 @@ class MainWindow(QMainWindow):
             self.search_next_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
             self.search_next_btn.setText('>')
             self.search_next_btn.clicked.connect(self.search_next_btn_clicked)
-            self.search_lower_frame_grid_layout.addWidget(self.search_next_btn, 0, 3, 1, 1)
+            self.search_lower_frame_grid_layout.addWidget(self.search_next_btn, 0, 4, 1, 1)
 
             self.adjust_search_nav_btns()
 
@@ -819,7 +960,7 @@ class MainWindow(QMainWindow):
             # disconnect to avoid trying to resave when deck is reverted (the reason for these reversions is when the user
             # changes the deck the search_save func is called, so when an error like above pops up the deck needs to be reverted)
             self.search_deck_selector.disconnect()
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
             self.search_deck_selector.currentTextChanged.connect(self.search_save)
             return
 
@@ -831,13 +972,13 @@ class MainWindow(QMainWindow):
             enter_qst_msg.exec_()
             # disconnect to avoid trying to resave when deck is reverted
             self.search_deck_selector.disconnect()
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
             self.search_deck_selector.currentTextChanged.connect(self.search_save)
             return
 
         # if the current qst equals original qst then just write to file, else check for duplicate qst
-        if search_qst == self.searched_cards[self.search_up_to]['Question']:
-            cards.write_card_edit_save(self.searched_cards[self.search_up_to], search_qst, search_ans)
+        if search_qst == self.search_cursor.get(self.search_up_to).question:
+            cards.write_card_edit_save(self.search_cursor.get(self.search_up_to), search_qst, search_ans)
         else:
             if cards.check_qst_exists(search_qst):
                 duplicate_qst_msg = QMessageBox()
@@ -847,39 +988,54 @@ class MainWindow(QMainWindow):
                 duplicate_qst_msg.exec_()
                 # disconnect to avoid trying to resave when deck is reverted
                 self.search_deck_selector.disconnect()
-                self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
+                self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
                 self.search_deck_selector.currentTextChanged.connect(self.search_save)
                 return
             else:
-                cards.write_card_edit_save(self.searched_cards[self.search_up_to], search_qst, search_ans)
-
-        cards.change_deck(self.searched_cards[self.search_up_to]['Deck'], self.search_deck_selector.currentText(), search_qst)
+                cards.write_card_edit_save(self.search_cursor.get(self.search_up_to), search_qst, search_ans)
+
+        cards.change_deck(self.search_cursor.get(self.search_up_to).deck, self.search_deck_selector.currentText(),
+                          self.search_cursor.get(self.search_up_to).id)
+
+        self.search_cursor.get(self.search_up_to).question = search_qst
+        self.search_cursor.get(self.search_up_to).answer = search_ans
+        self.search_cursor.get(self.search_up_to).deck = self.search_deck_selector.currentText()
+
+    def search_del_all_btn_clicked(self):
+        confirm_del_all_msg = QMessageBox()
+        confirm_del_all_msg.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        confirm_del_all_msg.setWindowTitle('Confirm Deletion')
+        confirm_del_all_msg.setText(f'Are you sure you want to delete all {self.search_cursor.count()} cards found by this search?')
+        confirm_del_all_msg.setStandardButtons(QMessageBox.Ok | QMessageBox.Cancel)
+        confirm_del_all_msg.setDefaultButton(QMessageBox.Cancel)
+        confirm_del_all_msg.exec_()
+        if confirm_del_all_msg.clickedButton().text() == 'OK':
+            cards.del_cards_by_id(self.search_cursor.get_card_ids())
 
-        self.searched_cards[self.search_up_to]['Question'] = search_qst
-        self.searched_cards[self.search_up_to]['Answer'] = search_ans
-        self.searched_cards[self.search_up_to]['Deck'] = self.search_deck_selector.currentText()
+            self.menu_study_btn.setText(f'Study {cards.get_num_to_study()}')
+            self.menu_search_btn_clicked()
 
     def search_del_btn_clicked(self):
-        cards.del_card(self.searched_cards[self.search_up_to])
-        self.searched_cards.pop(self.search_up_to)
+        cards.del_cards([self.search_cursor.get(self.search_up_to)])
+        self.search_cursor.remove(self.search_up_to)
 
         # Sets textChanged events to nothing (to avoid unnecessarily saving when changing cards).
         self.search_deck_selector.currentTextChanged.disconnect()
         self.search_qst_text.textChanged.disconnect()
         self.search_ans_text.textChanged.disconnect()
 
-        if len(self.searched_cards) == 0:
+        if not self.search_cursor.exists():
             self.menu_search_btn_clicked()
-        elif len(self.searched_cards) == self.search_up_to:
+        elif not self.search_cursor.has_index(self.search_up_to):
             self.search_up_to = self.search_up_to - 1
 
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
-            self.search_qst_text.setPlainText(self.searched_cards[self.search_up_to]['Question'])
-            self.search_ans_text.setPlainText(self.searched_cards[self.search_up_to]['Answer'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
+            self.search_qst_text.setPlainText(self.search_cursor.get(self.search_up_to).question)
+            self.search_ans_text.setPlainText(self.search_cursor.get(self.search_up_to).answer)
         else:
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
-            self.search_qst_text.setPlainText(self.searched_cards[self.search_up_to]['Question'])
-            self.search_ans_text.setPlainText(self.searched_cards[self.search_up_to]['Answer'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
+            self.search_qst_text.setPlainText(self.search_cursor.get(self.search_up_to).question)
+            self.search_ans_text.setPlainText(self.search_cursor.get(self.search_up_to).answer)
 
         self.search_deck_selector.currentTextChanged.connect(self.search_save)
         self.search_qst_text.textChanged.connect(self.search_save)
@@ -898,9 +1054,9 @@ class MainWindow(QMainWindow):
             self.search_qst_text.textChanged.disconnect()
             self.search_ans_text.textChanged.disconnect()
 
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
-            self.search_qst_text.setPlainText(self.searched_cards[self.search_up_to]['Question'])
-            self.search_ans_text.setPlainText(self.searched_cards[self.search_up_to]['Answer'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
+            self.search_qst_text.setPlainText(self.search_cursor.get(self.search_up_to).question)
+            self.search_ans_text.setPlainText(self.search_cursor.get(self.search_up_to).answer)
 
             self.search_deck_selector.currentTextChanged.connect(self.search_save)
             self.search_qst_text.textChanged.connect(self.search_save)
@@ -909,7 +1065,7 @@ class MainWindow(QMainWindow):
             self.adjust_search_nav_btns()
 
     def search_next_btn_clicked(self):
-        if self.search_up_to < len(self.searched_cards) - 1:
+        if self.search_cursor.has_index(self.search_up_to + 1):
 
             # Sets textChanged events to nothing (to avoid unnecessarily saving when changing cards).
             self.search_deck_selector.currentTextChanged.disconnect()
@@ -918,9 +1074,9 @@ class MainWindow(QMainWindow):
 
             self.search_up_to = self.search_up_to + 1
 
-            self.search_deck_selector.setCurrentText(self.searched_cards[self.search_up_to]['Deck'])
-            self.search_qst_text.setPlainText(self.searched_cards[self.search_up_to]['Question'])
-            self.search_ans_text.setPlainText(self.searched_cards[self.search_up_to]['Answer'])
+            self.search_deck_selector.setCurrentText(self.search_cursor.get(self.search_up_to).deck)
+            self.search_qst_text.setPlainText(self.search_cursor.get(self.search_up_to).question)
+            self.search_ans_text.setPlainText(self.search_cursor.get(self.search_up_to).answer)
 
             self.search_deck_selector.currentTextChanged.connect(self.search_save)
             self.search_qst_text.textChanged.connect(self.search_save)
@@ -947,7 +1103,7 @@ class MainWindow(QMainWindow):
                                                 }
             ''')
 
-        if (self.search_up_to + 1) == len(self.searched_cards):
+        if not self.search_cursor.has_index(self.search_up_to + 1):
             self.search_next_btn.setEnabled(False)
             self.search_next_btn.setStyleSheet('''
                                             #search_next_btn{
@@ -968,19 +1124,24 @@ class MainWindow(QMainWindow):
     def empty_event(self, e):
         return None
 
-    def menu_study_btn_clicked(self, deck=False):
+    def menu_study_btn_clicked(self):
+        # Built once when studying starts, so the next card does not have to be looked for after every answer.
+        self.study_session = study.StudySession()
+        self.show_study_card()
+
+    def show_study_card(self, deck=False):
         self.clear_layout(self.main_frame_grid_layout)
 
         self.menu_study_btn.setText(f"Study {cards.get_num_to_study()}")
 
-        self.current_card = cards.get_card(deck)
+        self.current_card = self.study_session.get_card(deck)
 
         if self.current_card:
             self.study_qst_text = QtWidgets.QTextEdit(self.main_frame)
             self.study_qst_text.setTabChangesFocus(True)
             self.study_qst_text.setObjectName("study_qst_text")
             self.study_qst_text.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
-            self.study_qst_text.setPlainText(self.current_card['Question'])
+            self.study_qst_text.setPlainText(self.current_card.question)
             self.study_qst_text.setReadOnly(True)
             self.study_qst_text.setStyleSheet('''
                                             #study_qst_text{
@@ -1043,7 +1204,7 @@ class MainWindow(QMainWindow):
             self.main_frame_grid_layout.addItem(completed_lower_spacer, 1, 0, 1, 1)
 
     def study_ans_btn_clicked(self):
-        self.study_ans_text.setPlainText(self.current_card["Answer"])
+        self.study_ans_text.setPlainText(self.current_card.answer)
 
         # Done to change focus off of self.study_ans_btn before it is cleared.
         self.menu_study_btn.setFocus()
@@ -1076,14 +1237,17 @@ class MainWindow(QMainWindow):
         study_lower_btns_frame_right_spacer = QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.study_lower_btns_frame_grid_layout.addItem(study_lower_btns_frame_right_spacer, 0, 4, 1, 1)
 
+        # The next card is loaded once the answer has been shown, so it can be shown as soon as a button is clicked.
+        QtCore.QTimer.singleShot(0, lambda: self.study_session.prefetch(self.current_card.deck))
+
     def study_correct_btn_clicked(self):
-        cards.correct_ans(self.current_card)
-        self.menu_study_btn_clicked(self.current_card['Deck'])
+        self.study_session.answer(self.current_card, True)
+        self.show_study_card(self.current_card.deck)
         self.menu_study_btn.setText(f"Study {cards.get_num_to_study()}")
 
     def study_again_btn_clicked(self):
-        cards.again_ans(self.current_card)
-        self.menu_study_btn_clicked(self.current_card['Deck'])
+        self.study_session.answer(self.current_card, False)
+        self.show_study_card(self.current_card.deck)
         self.menu_study_btn.setText(f"Study {cards.get_num_to_study()}")
 
     def menu_add_cards_btn_clicked(self):
@@ -1212,6 +1376,23 @@ class MainWindow(QMainWindow):
             enter_qst_msg.exec_()
             return
 
+        # Only checked if turned on in the settings. Returns None (and the card is added without being checked) while
+        # the index is still being built in the background. An exact duplicate is not asked about, as add_card() rejects
+        # it.
+        near_duplicates = None
+        if settings.get_check_near_duplicates() and not cards.check_qst_exists(add_qst):
+            near_duplicates = cards.find_near_duplicates(add_qst)
+        if near_duplicates:
+            near_duplicate_msg = QMessageBox()
+            near_duplicate_msg.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+            near_duplicate_msg.setWindowTitle('Possible Duplicate')
+            near_duplicate_msg.setText(f'A card with a similar question already exists:\n\n{near_duplicates[0].question}'
+                                       f'\n\nAdd this card anyway?')
+            near_duplicate_msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+            near_duplicate_msg.setDefaultButton(QMessageBox.No)
+            if near_duplicate_msg.exec_() != QMessageBox.Yes:
+                return
+
         if not cards.add_card(self.add_cards_deck_selector.currentText(), add_qst, add_ans):
             duplicate_qst_msg = QMessageBox()
             duplicate_qst_msg.setWindowTitle('Duplicate')
@@ -1263,7 +1444,7 @@ class MainWindow(QMainWindow):
         for deck in deck_lines:
             self.deck_list_widget.addItem(deck)
         self.deck_list_widget.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
-        self.main_frame_grid_layout.addWidget(self.deck_list_widget, 1, 0, 3, 1)
+        self.main_frame_grid_layout.addWidget(self.deck_list_widget, 1, 0, 4, 1)
 
         self.del_deck_btn = QtWidgets.QPushButton()
         self.del_deck_btn.setObjectName('del_deck_btn')
@@ -1289,8 +1470,21 @@ class MainWindow(QMainWindow):
         self.rename_deck_btn.clicked.connect(self.rename_deck_btn_clicked)
         self.main_frame_grid_layout.addWidget(self.rename_deck_btn, 2, 1, 1, 1)
 
+        self.import_cards_btn = QtWidgets.QPushButton()
+        self.import_cards_btn.setObjectName('import_cards_btn')
+        self.import_cards_btn.setStyleSheet('''
+                                                #import_cards_btn{
+                                                    color: white;
+                                                }
+                ''')
+        self.import_cards_btn.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        self.import_cards_btn.setText('Import')
+        self.import_cards_btn.setToolTip('Import cards from a .csv or .tsv file (question, answer) into the selected deck')
+        self.import_cards_btn.clicked.connect(self.import_cards_btn_clicked)
+        self.main_frame_grid_layout.addWidget(self.import_cards_btn, 3, 1, 1, 1)
+
         deck_lower_right_spacer = QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.main_frame_grid_layout.addItem(deck_lower_right_spacer, 3, 1, 1, 1)
+        self.main_frame_grid_layout.addItem(deck_lower_right_spacer, 4, 1, 1, 1)
 
     def add_deck_btn_clicked(self):
         deck_name = self.add_deck_line_edit.text().strip()
@@ -1400,6 +1594,62 @@ class MainWindow(QMainWindow):
         self.menu_decks_btn_clicked()
         self.add_deck_line_edit.setText(add_deck_value)
 
+    def import_cards_btn_clicked(self):
+        # Returns if nothing selected.
+        if not self.deck_list_widget.selectedIndexes():
+            return
+
+        selected_deck_import = self.deck_list_widget.currentItem().text().strip()
+
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Import Cards', '', 'Card files (*.csv *.tsv)')
+        if not path:
+            return
+
+        try:
+            added_rows, skipped_rows, near_duplicate_rows, invalid_rows = cards.import_cards(
+                path, selected_deck_import, settings.get_check_near_duplicates(), check_valid_chars
+            )
+        except (UnicodeDecodeError, csv.Error) as error:
+            import_error_msg = QMessageBox()
+            import_error_msg.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+            import_error_msg.setWindowTitle('Import')
+            import_error_msg.setText('The file could not be read. It must be a .csv or .tsv file saved as UTF-8.')
+            import_error_msg.setDetailedText(str(error))
+            import_error_msg.setIcon(QMessageBox.Warning)
+            import_error_msg.exec_()
+            return
+
+        # Decks named in the file are added if any of their cards were imported (add_deck() skips existing decks).
+        for new_deck in dict.fromkeys(row[0] for row in added_rows):
+            decks.add_deck(new_deck)
+
+        imported_msg = QMessageBox()
+        imported_msg.setFont(QFont('MS Shell Dlg 2', settings.get_font_size()))
+        imported_msg.setWindowTitle('Import')
+        if near_duplicate_rows is None:
+            near_duplicate_text = ' Similar questions were not checked, as they are still being indexed.'
+            near_duplicate_rows = []
+        elif settings.get_check_near_duplicates():
+            near_duplicate_text = f' {len(near_duplicate_rows)} imported cards have a question similar to another card.'
+        else:
+            near_duplicate_text = ''
+        imported_msg.setText(f'{len(added_rows)} cards imported. {len(skipped_rows)} cards were skipped as their question already exists.'
+                             f' {len(invalid_rows)} cards were skipped as they have invalid characters.'
+                             f'{near_duplicate_text}')
+        detailed_text = ''
+        if skipped_rows:
+            detailed_text += 'Skipped:\n' + '\n'.join(row[1] for row in skipped_rows) + '\n\n'
+        if invalid_rows:
+            detailed_text += 'Invalid characters:\n' + '\n'.join(repr(row[1]) for row in invalid_rows) + '\n\n'
+        if near_duplicate_rows:
+            detailed_text += 'Similar to another card:\n' + '\n'.join(row[1] for row in near_duplicate_rows)
+        if detailed_text:
+            imported_msg.setDetailedText(detailed_text.strip())
+        imported_msg.exec_()
+
+        self.menu_study_btn.setText(f"Study {cards.get_num_to_study()}")
+        self.menu_decks_btn_clicked()
+
     def clear_layout(self, layout):
         if layout is not None:
             while layout.count():
@@ -1439,8 +1689,16 @@ if __name__ == "__main__":
     backups.backups_on_device()
     backups.create_back_up()
     backups.delete_old_backups()
+    cards.start_near_duplicate_index()
 
     app = QApplication(sys.argv)
     main_window = MainWindow()
     main_window.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    # Answers are saved (and the shards compacted) in background threads, so any still waiting are written before the
+    # app closes.
+    cards.get_card_store().flush_writes()
+    cards.get_card_store().wait_for_compaction()
+    review_log.flush()
+    stats.flush()
+    sys.exit(exit_code)
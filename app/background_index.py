@@ -0,0 +1,115 @@
+"""
+Contains the base class of the card indexes that are built in a background thread, so building one for a large
+collection does not freeze the window.
+"""
+
+import threading
+
+
+class BackgroundIndex:
+    """
+    An index of the CardStore's cards that is built in a background thread. Until it is ready, lookups return None, so
+    the caller can fall back to checking every card (or skip the check).
+
+    The build works from a snapshot of the cards taken (by get_item()) when it starts, so the thread never reads
+    self.cards. Cards added, changed or deleted while it is running are queued, and applied once the build has
+    finished. Subclasses implement get_item(), build() and apply().
+    """
+
+    def __init__(self, cards):
+        """
+        cards is the dict of ID: card held by the CardStore (with their questions and answers loaded).
+        """
+        self.cards = cards
+        # Held while the built index is installed, and while changes are queued or applied.
+        self.lock = threading.Lock()
+        self.ready = False
+        self.pending = []
+        self.thread = None
+        self.start_build()
+
+    def start_build(self):
+        """
+        Starts (re)building the index in a background thread. Lookups return None until it has finished.
+        """
+        items = [(card.id, self.get_item(card)) for card in self.cards.values()]
+
+        with self.lock:
+            self.ready = False
+            self.pending = []
+
+        self.thread = threading.Thread(target=self.run_build, args=(items,), daemon=True)
+        self.thread.start()
+
+    def run_build(self, items):
+        """
+        Run by the build thread. Builds the index from the snapshot, then applies the changes made since it was taken.
+        """
+        built = self.build(items)
+
+        with self.lock:
+            self.install(built)
+            for change in self.pending:
+                self.apply(*change)
+            self.pending = []
+            self.ready = True
+
+    def wait(self):
+        """
+        Returns once the index is ready.
+        """
+        if self.thread is not None:
+            self.thread.join()
+
+    def change(self, card_id, item):
+        """
+        Applies a change to the card with ID card_id, whose new snapshot is item (None if it has been deleted), or
+        queues it if the index is still being built.
+        """
+        with self.lock:
+            if self.ready:
+                self.apply(card_id, item)
+            else:
+                self.pending.append((card_id, item))
+
+    def add(self, card):
+        """
+        Indexes a new card.
+        """
+        self.change(card.id, self.get_item(card))
+
+    def update(self, card):
+        """
+        Re-indexes a card whose question or answer may have changed.
+        """
+        self.change(card.id, self.get_item(card))
+
+    def delete(self, card_id):
+        """
+        Called when a card has been deleted.
+        """
+        self.change(card_id, None)
+
+    def get_item(self, card):
+        """
+        Returns what the index needs from a card (e.g. its text), as the build thread can not read the cards.
+        """
+        raise NotImplementedError
+
+    def build(self, items):
+        """
+        Run by the build thread. Returns the index built from a list of (card ID, item from get_item()).
+        """
+        raise NotImplementedError
+
+    def install(self, built):
+        """
+        Replaces the index with one returned by build().
+        """
+        raise NotImplementedError
+
+    def apply(self, card_id, item):
+        """
+        Applies a change to the index (item is None if the card has been deleted).
+        """
+        raise NotImplementedError
@@ -5,6 +5,9 @@ This module is for creating and restoring backups.
 import tempfile
 import os
 import datetime
+import cards
+import stats
+import review_log
 
 
 temp_path = tempfile.gettempdir()
@@ -41,9 +44,16 @@ def backups_on_device():
 
 def create_back_up(name=False):
     """
-    Makes a back up of again_dates_1440.txt, cards.csv, correct_dates_1440.txt, decks.txt, settings.csv, and stats.csv.
+    Makes a back up of the card files, decks.txt, reviews_1440.csv, review_log.bin and settings.csv.
     Return False is the name already exists, otherwise returns True.
     """
+    # Makes sure every answer has been saved, and the card files and journal are not copied while a compaction is part
+    # way through changing them.
+    cards.get_card_store().flush_writes()
+    cards.get_card_store().wait_for_compaction()
+    review_log.flush()
+    stats.flush()
+
     if name:
         if os.path.exists(f'{temp_path}\\..\\MemoryGain\\backups\\{name}'):
             return False
@@ -64,6 +74,12 @@ def create_back_up(name=False):
 
 
 def restore_backup(name):
+    # The current journal belongs to the current card files, so it must not be replayed over the restored ones.
+    cards.get_card_store().delete_journal()
+    # Answers still being written would otherwise be added to the restored review log and results.
+    review_log.flush()
+    stats.flush()
+
     # Handles restoring a backup that was made automatically.
     if '<auto>' in name:
         os.system(f'copy {temp_path}\\..\\MemoryGain\\backups\\{name.split("<")[0].strip()}\\* {temp_path}\\..\\MemoryGain\\')
@@ -71,6 +87,12 @@ def restore_backup(name):
     else:
         os.system(f'copy "{temp_path}\\..\\MemoryGain\\backups\\{name}\\*" {temp_path}\\..\\MemoryGain\\')
 
+    # The restored card files (and journal) replace the ones the cards in memory were loaded from.
+    cards.get_card_store().load()
+    cards.start_near_duplicate_index()
+    # Migrates the results of a backup made before they were counted by day, and reads the restored results.
+    stats.stats_on_device()
+
 
 def del_backup(name):
     if '<auto>' in name:
@@ -1,27 +1,49 @@
 """
-This module is for managing cards. It contains functions for manipulating cards.csv.
+This module is for managing cards. It contains functions for manipulating the card files (cards_manifest.csv, one
+cards_<n>.csv file per deck, card_bodies.csv and cards_next_id.txt), or the cards table in memorygain.db.
 """
 
 import tempfile
+import io
 import re
 import datetime
+import time
 import os
 import csv
+import threading
+import heapq
+import itertools
 import stats
 import settings
 import stats
 import linear_regression
+import database
+import search_index
+import search_query
+import near_duplicates
+import writer
+import review_log
 
 
 temp_path = tempfile.gettempdir()
-# Fields for cards.csv.
-fields = ['Deck', 'Question', 'Answer', 'Ease', 'Due', 'Interval', 'Phase']
+# Fields for cards_journal.csv (and cards.csv, which was used before the cards were split into a file per deck). Each
+# card's ID is a number that never changes, so cards can be looked up without comparing questions. Due is a Unix
+# timestamp (in seconds). Questions and answers are kept in card_bodies.csv, and Body Offset and Body Length are where
+# the card's row in it is (in bytes).
+fields = ['ID', 'Deck', 'Ease', 'Due', 'Interval', 'Phase', 'Body Offset', 'Body Length']
+# Fields for each deck's cards_<n>.csv (shard) file. The deck is not needed, as it is the same for every card in the
+# file.
+shard_fields = ['ID', 'Ease', 'Due', 'Interval', 'Phase', 'Body Offset', 'Body Length']
+# Fields for cards_manifest.csv, which has the shard file of each deck.
+manifest_fields = ['Deck', 'File']
+# Fields for card_bodies.csv.
+body_fields = ['ID', 'Question', 'Answer']
 
 
 def cards_on_device():
     """
-    Checks if cards.csv is on device, if not it is added. decks.decks_on_device() must be called first to make
-    the MemoryGain dir.
+    Checks if the card files are on device, if not they are added. decks.decks_on_device() must be called first to
+    make the MemoryGain dir.
     """
     # Due to the way cards were stored in the test version of MemoryGain, it reformats old cards to the new format.
     old_cards = []
@@ -33,12 +55,16 @@ def cards_on_device():
 
         os.system(f'del {temp_path}\\..\\MemoryGain\\cards.txt')
 
-    cards_found = os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards.csv')
+    # cards.csv is still there if the cards have not been split into shards yet.
+    cards_found = os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards_manifest.csv') or \
+        os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards.csv')
 
     if not cards_found:
-        with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-            writer = csv.writer(cards_file)
-            writer.writerow(fields)
+        write_manifest({})
+        open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv', 'w').close()
+
+    # Loads all cards into memory once, every other function in this module then works from the CardStore.
+    get_card_store()
 
     for old_card in old_cards:
         deck = old_card.split('QUESTION^^$=')[0]
@@ -47,375 +73,1638 @@ def cards_on_device():
         add_card(deck, question, answer)
 
 
-def get_num_to_study(deck=False):
+def add_card_ids():
     """
-    Find out how many cards need to be studied today. Returns int. By default will count all cards, however if a deck
-    is specified, it only counts cards due that belong to that deck.
+    Cards made before card IDs were added have no ID column in cards.csv. If that is the case, cards.csv is rewritten
+    (with any journals applied) giving every card an ID.
     """
-    amt_to_study = 0
+    if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards.csv'):
+        return
 
     with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        if not deck:
-            for card in dict_reader:
-                if card['Due'][:10] <= datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d'):
-                    amt_to_study += 1
-        else:
-            for card in dict_reader:
-                if (card['Due'][:10] <= datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d')) and (card['Deck'] == deck):
-                    amt_to_study += 1
+        header = next(csv.reader(cards_file), [])
 
-    return amt_to_study
+    if 'ID' in header:
+        return
 
-
-def del_deck_cards(deck):
-    """
-    Deletes all cards in a deck.
-    """
-    cards_not_in_deck = []
+    old_fields = ['Deck', 'Question', 'Answer', 'Ease', 'Due', 'Interval', 'Phase']
+    old_cards = {}
 
     with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
+        dict_reader = csv.DictReader(cards_file, fieldnames=old_fields)
         # Skips header row.
         next(dict_reader)
         for card in dict_reader:
-            if card['Deck'] != deck:
-                cards_not_in_deck.append(card)
+            old_cards[card['Question']] = card
+
+    # Journals from before card IDs were keyed by question, with an Old Question column for edited questions.
+    for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+        if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+            continue
+
+        with open(f'{temp_path}\\..\\MemoryGain\\{journal}', 'r') as journal_file:
+            dict_reader = csv.DictReader(journal_file, fieldnames=old_fields + ['Old Question'])
+            for row in dict_reader:
+                card = {field: row[field] for field in old_fields}
+                if None in card.values():
+                    continue
+
+                if row['Old Question'] and row['Old Question'] in old_cards:
+                    old_cards[card['Question']] = old_cards.pop(row['Old Question'])
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
+                old_cards.setdefault(card['Question'], {}).update(card)
+
+    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv.new', 'w', newline='') as cards_file:
+        # Written in the format used before questions and answers were moved to card_bodies.csv, which
+        # split_card_bodies() then converts.
+        dict_writer = csv.DictWriter(cards_file, fieldnames=['ID'] + old_fields)
         dict_writer.writeheader()
-        dict_writer.writerows(cards_not_in_deck)
+        for card_id, card in enumerate(old_cards.values(), start=1):
+            dict_writer.writerow(dict(card, ID=str(card_id)))
 
+    os.replace(f'{temp_path}\\..\\MemoryGain\\cards.csv.new', f'{temp_path}\\..\\MemoryGain\\cards.csv')
 
-def get_card(deck=False):
+    for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+            os.remove(f'{temp_path}\\..\\MemoryGain\\{journal}')
+
+
+def split_card_bodies():
     """
-    Returns False if no cards are due sometime today. Else it returns a dictionary with the details of the most overdue card.
-    deck is an optional parameter that specifies the deck to get the card from, if no cards are due in that deck it returns a
-    card from another deck (if one is due, otherwise returns False) (this is done so cards in the same deck are studied together).
+    cards.csv used to hold each card's question and answer. If it still does, they are moved to card_bodies.csv (with
+    any journals applied first), and cards.csv is rewritten with just the other fields.
     """
-    card_due = False
+    if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards.csv'):
+        return
+
     with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        # Skips header.
+        header = next(csv.reader(cards_file), [])
+
+    if 'Question' not in header:
+        return
+
+    old_fields = ['ID', 'Deck', 'Question', 'Answer', 'Ease', 'Due', 'Interval', 'Phase']
+    old_cards = {}
+
+    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
+        dict_reader = csv.DictReader(cards_file, fieldnames=old_fields)
+        # Skips header row.
         next(dict_reader)
         for card in dict_reader:
-            if card['Due'][:10] <= datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d'):
-                card_due = True
+            old_cards[card['ID']] = card
+
+    for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+        if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+            continue
+
+        with open(f'{temp_path}\\..\\MemoryGain\\{journal}', 'r') as journal_file:
+            dict_reader = csv.DictReader(journal_file, fieldnames=old_fields)
+            for card in dict_reader:
+                if None not in card.values():
+                    old_cards[card['ID']] = card
+
+    # card_bodies.csv is swapped in first. If the app closes before cards.csv is, cards.csv is still in the old format,
+    # and this is simply done again.
+    with open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv.new', 'wb') as bodies_file:
+        with open(f'{temp_path}\\..\\MemoryGain\\cards.csv.new', 'w', newline='') as cards_file:
+            writer = csv.writer(cards_file)
+            writer.writerow(fields)
+            for card in old_cards.values():
+                body = encode_body([card['ID'], card['Question'], card['Answer']])
+                writer.writerow([card['ID'], card['Deck'], card['Ease'], card['Due'], card['Interval'], card['Phase'],
+                                 bodies_file.tell(), len(body)])
+                bodies_file.write(body)
+
+    os.replace(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv.new', f'{temp_path}\\..\\MemoryGain\\card_bodies.csv')
+    os.replace(f'{temp_path}\\..\\MemoryGain\\cards.csv.new', f'{temp_path}\\..\\MemoryGain\\cards.csv')
+
+    for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+            os.remove(f'{temp_path}\\..\\MemoryGain\\{journal}')
+
+
+def shard_cards():
+    """
+    Cards used to be kept in a single cards.csv, rather than a file per deck. If cards.csv is there (restoring an old
+    backup also brings it back), its cards are moved into shard files, cards_manifest.csv is rewritten, and cards.csv is
+    removed. The journals have the same fields as cards.csv, so they are left to be replayed over the shards.
+    """
+    if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards.csv'):
+        return
+
+    deck_rows = {}
+
+    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
+        reader = csv.reader(cards_file)
+        # Skips header row.
+        next(reader)
+        for row in reader:
+            deck_rows.setdefault(row[1], []).append(row[:1] + row[2:])
+
+    shards = {}
+
+    for deck, rows in deck_rows.items():
+        shards[deck] = f'cards_{len(shards)}.csv'
+        write_shard(shards[deck], rows)
+
+    # If the app closes before cards.csv is removed, this is simply done again.
+    write_manifest(shards)
+    os.remove(f'{temp_path}\\..\\MemoryGain\\cards.csv')
+
+
+def read_manifest():
+    """
+    Returns a dict of each deck's shard file name from cards_manifest.csv.
+    """
+    with open(f'{temp_path}\\..\\MemoryGain\\cards_manifest.csv', 'r') as manifest_file:
+        dict_reader = csv.DictReader(manifest_file)
+
+        return {row['Deck']: row['File'] for row in dict_reader}
+
+
+def write_manifest(shards):
+    """
+    Writes cards_manifest.csv from a dict of each deck's shard file name.
+    """
+    with open(f'{temp_path}\\..\\MemoryGain\\cards_manifest.csv.new', 'w', newline='') as manifest_file:
+        writer = csv.writer(manifest_file)
+        writer.writerow(manifest_fields)
+        writer.writerows(shards.items())
+
+    os.replace(f'{temp_path}\\..\\MemoryGain\\cards_manifest.csv.new',
+               f'{temp_path}\\..\\MemoryGain\\cards_manifest.csv')
+
+
+def read_next_card_id():
+    """
+    Returns the ID from cards_next_id.txt (the ID the next new card will be given), or 0 if it is not there.
+    """
+    if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards_next_id.txt'):
+        return 0
+
+    with open(f'{temp_path}\\..\\MemoryGain\\cards_next_id.txt', 'r') as next_id_file:
+        return int(next_id_file.read().strip() or 0)
+
+
+def write_next_card_id(next_id):
+    """
+    Writes next_id to cards_next_id.txt (a new file is written and then swapped in).
+    """
+    with open(f'{temp_path}\\..\\MemoryGain\\cards_next_id.txt.new', 'w') as next_id_file:
+        next_id_file.write(str(next_id))
+
+    os.replace(f'{temp_path}\\..\\MemoryGain\\cards_next_id.txt.new',
+               f'{temp_path}\\..\\MemoryGain\\cards_next_id.txt')
+
+
+def write_shard(shard, rows):
+    """
+    Writes rows (in the order of shard_fields) to the shard file named shard. A new file is written and then swapped in,
+    so the shard is never left half-written.
+    """
+    with open(f'{temp_path}\\..\\MemoryGain\\{shard}.new', 'w', newline='') as shard_file:
+        writer = csv.writer(shard_file)
+        writer.writerow(shard_fields)
+        writer.writerows(rows)
+
+    os.replace(f'{temp_path}\\..\\MemoryGain\\{shard}.new', f'{temp_path}\\..\\MemoryGain\\{shard}')
+
+
+def encode_body(row):
+    """
+    Returns a row of card_bodies.csv (ID, question, answer) as bytes, ready to be written to the file.
+    """
+    body = io.StringIO()
+    csv.writer(body).writerow(row)
+
+    return body.getvalue().encode('utf-8')
+
+
+def decode_body(body):
+    """
+    Returns the row of card_bodies.csv in body (bytes written by encode_body()), or None if body is not exactly one row.
+    """
+    try:
+        rows = list(csv.reader(io.StringIO(body.decode('utf-8'), newline='')))
+    except (UnicodeDecodeError, csv.Error):
+        return None
+
+    if len(rows) != 1 or len(rows[0]) != len(body_fields):
+        return None
+
+    return rows[0]
+
+
+def remove_partial_row(journal):
+    """
+    Cuts a journal back to the end of its last complete row. If the app closed part way through appending to it, the
+    partial row is removed, so the next row is not written onto the end of it (and lost along with it).
+    """
+    if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+        return
+
+    with open(f'{temp_path}\\..\\MemoryGain\\{journal}', 'r+b') as journal_file:
+        end = journal_file.seek(0, os.SEEK_END)
+        position = end
+
+        # Looks back from the end for the last newline, a block at a time.
+        while position > 0:
+            start = max(position - 4096, 0)
+            journal_file.seek(start)
+            newline = journal_file.read(position - start).rfind(b'\n')
+            if newline != -1:
+                position = start + newline + 1
                 break
+            position = start
 
-    if not card_due:
-        return False
+        if position != end:
+            journal_file.truncate(position)
 
-    else:
-        with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-            dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-            # Skips header.
-            next(dict_reader)
 
-            # Gets only those due today and sorts them in ascending order, according to due date.
-            cards_today = []
-            for card in dict_reader:
-                if card['Due'][:10] <= datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d'):
-                    cards_today.append(card)
+def parse_due(due):
+    """
+    Returns a due date from the card files (or memorygain.db) as a timestamp. Due dates used to be stored as local date
+    and times (e.g. 2024-01-31 09:30:00.123456), which are converted.
+    """
+    if due.isdigit():
+        return int(due)
 
-            cards_today_asc = sorted(cards_today, key=lambda card: card['Due'])
+    return int(datetime.datetime.fromisoformat(due).timestamp())
 
-        card_from_deck = False
+
+def get_end_of_today():
+    """
+    Returns the timestamp of the coming midnight. A card is due today if it is due before then.
+    """
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+    return int(datetime.datetime.combine(tomorrow, datetime.time()).timestamp())
+
+
+class Card:
+    """
+    A card held in memory. __slots__ means each card has no __dict__, so large collections take much less memory, and
+    Ease, Due and Interval are kept as numbers so they are not parsed from strings every time they are used.
+
+    question and answer are None until they are loaded by CardStore.load_body() (or load_bodies()), as scheduling
+    does not need them.
+    """
+
+    __slots__ = ('id', 'deck', 'question', 'answer', 'ease', 'due', 'interval', 'phase', 'body_offset', 'body_length')
+
+    def __init__(self, card_id, deck, question, answer, ease, due, interval, phase, body_offset=None, body_length=None):
+        self.id = card_id
+        self.deck = deck
+        self.question = question
+        self.answer = answer
+        self.ease = ease
+        self.due = due
+        self.interval = interval
+        self.phase = phase
+        self.body_offset = body_offset
+        self.body_length = body_length
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Returns a card made from a row of cards_journal.csv (a list of strings in the same order as fields). Rows from
+        memorygain.db do not have Body Offset and Body Length.
+        """
+        card_id, deck, ease, due, interval, phase = row[:6]
+        card = cls(int(card_id), deck, None, None, float(ease), parse_due(str(due)), int(interval), phase)
+
+        if len(row) > 6:
+            card.body_offset = int(row[6])
+            card.body_length = int(row[7])
+
+        return card
+
+    def to_row(self):
+        """
+        Returns the card as a row of cards_journal.csv (in the same order as fields).
+        """
+        return [self.id, self.deck, self.ease, self.due, self.interval, self.phase, self.body_offset, self.body_length]
+
+    def to_shard_row(self):
+        """
+        Returns the card as a row of its deck's shard file (in the same order as shard_fields).
+        """
+        return [self.id, self.ease, self.due, self.interval, self.phase, self.body_offset, self.body_length]
+
+    def copy(self):
+        return Card(self.id, self.deck, self.question, self.answer, self.ease, self.due, self.interval, self.phase,
+                    self.body_offset, self.body_length)
+
+
+class CardStore:
+    """
+    Holds every card in memory, so the card files are only read once (on startup) rather than on every call. Single
+    card changes are appended to the journal by a background thread, and other changes rewrite the changed shards
+    straight away (see load() and compact()). self.questions (built by load_bodies()) is the hash index used to check a
+    question is unique, and the due heaps find the most overdue card without sorting every card.
+    """
+
+    journal_limit = 1000
+
+    def __init__(self):
+        # Maps each card ID to its card. Dicts keep insertion order, so this is also the order of the cards in the
+        # shards.
+        self.cards = {}
+        # Maps each deck to its shard file name (as in cards_manifest.csv).
+        self.shards = {}
+        self.next_shard = 0
+        # Decks whose shards are out of date (the changes are in the journal, or are about to be written).
+        self.dirty_decks = set()
+        # Maps each question to its card's ID (each question is unique). Only complete once bodies_loaded is True.
+        self.questions = {}
+        self.bodies_loaded = False
+        self.next_id = 1
+        self.loaded = False
+        # Set by read_row() if any due dates were stored in the old date format.
+        self.old_due_dates_found = False
+        self.journal_length = 0
+        self.compaction_thread = None
+        # Saves answers (and other single card changes) in the background, so the window does not wait for the disk.
+        self.writer = writer.BackgroundWriter(self.write_batch)
+        # Held while the card files or the journals are being written to.
+        self.files_lock = threading.Lock()
+        # Entries are (Due, order, ID). order keeps cards with the same due date in the order they were indexed.
+        self.due_heap = []
+        self.deck_due_heaps = {}
+        self.due_order = itertools.count()
+        # Maps the ID of each card due before due_cutoff (the end of today) to its deck, along with the number of those
+        # cards in each deck. Kept up to date as cards change, so the due counts do not need every card to be checked.
+        self.due_cutoff = 0
+        self.due_today = {}
+        self.due_counts = {}
+        # Built (in the background) the first time cards are searched for.
+        self.text_index = None
+        # Built (in the background) the first time cards with a similar question are looked for.
+        self.near_duplicate_index = None
+
+    def load(self):
+        """
+        (Re)loads all cards.
+        """
+        self.flush_writes()
+        self.wait_for_compaction()
+        self.old_due_dates_found = False
+        self.read()
+        # Written straight back, so old due dates are only converted once.
+        if self.old_due_dates_found:
+            self.dirty_decks.update(card.deck for card in self.cards.values())
+            self.write()
+        self.questions = {}
+        self.bodies_loaded = False
+        # IDs are never reused, so a deleted card's reviews are not counted as another card's. The stored ID is ahead of
+        # the cards if the newest ones have been deleted.
+        self.next_id = max(max(self.cards, default=0) + 1, self.read_next_id())
+        self.loaded = True
+        self.build_due_index()
+        self.count_all_due()
+        self.text_index = None
+        self.near_duplicate_index = None
+
+    def read(self):
+        """
+        Reads every shard into self.cards, and replays any journals over them.
+        """
+        add_card_ids()
+        split_card_bodies()
+        shard_cards()
+        self.cards = {}
+        self.dirty_decks = set()
+        self.shards = read_manifest()
+        self.next_shard = max((int(shard[6:-4]) + 1 for shard in self.shards.values()), default=0)
+
+        for deck, shard in self.shards.items():
+            if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\{shard}'):
+                continue
+
+            with open(f'{temp_path}\\..\\MemoryGain\\{shard}', 'r') as shard_file:
+                reader = csv.reader(shard_file)
+                # Skips header row.
+                next(reader)
+                for row in reader:
+                    card_id = int(row[0])
+                    # A card can only be in two shards if the app closed part way through moving it, so both shards
+                    # are rewritten.
+                    if card_id in self.cards:
+                        self.dirty_decks.update((deck, self.cards[card_id].deck))
+
+                    self.read_row(row[:1] + [deck] + row[1:])
+
+        # cards_journal_compacting.csv is only left behind if the app closed part way through a compaction, in which
+        # case each shard is either old or new. Both are brought up to date by replaying the journals in order.
+        compacting_journal_found = os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards_journal_compacting.csv')
+        self.journal_length = 0
+
+        for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+            if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+                continue
+
+            with open(f'{temp_path}\\..\\MemoryGain\\{journal}', 'r') as journal_file:
+                journal_rows = journal_file.read()
+
+            # Every complete row ends with a newline, so anything after the last one was only partly written (the app
+            # closed while writing it), even if it happens to have the right number of fields.
+            journal_rows = journal_rows[:journal_rows.rfind('\n') + 1]
+
+            for row in csv.reader(io.StringIO(journal_rows)):
+                # A row with missing fields can not be read either.
+                if len(row) != len(fields):
+                    continue
+
+                # The card's old deck (if it was moved) and new deck both need their shards rewritten.
+                card = self.cards.get(int(row[0]))
+                if card is not None:
+                    self.dirty_decks.add(card.deck)
+                self.dirty_decks.add(row[1])
+
+                self.read_row(row)
+                self.journal_length += 1
+
+        if compacting_journal_found:
+            self.write()
+
+    def read_row(self, row):
+        """
+        Adds a card read from a row of a shard (with its deck added), a journal or memorygain.db to self.cards
+        (replacing any earlier version of it).
+        """
+        card = Card.from_row(row)
+        self.cards[card.id] = card
+
+        if not str(row[3]).isdigit():
+            self.old_due_dates_found = True
+
+    def load_body(self, card):
+        """
+        Loads a card's question and answer, if they are not already in memory.
+        """
+        if card.question is None:
+            self.read_body(card)
+
+    def load_bodies(self):
+        """
+        Loads the question and answer of every card, if they are not already in memory, and builds self.questions.
+        """
+        if self.bodies_loaded:
+            return
+
+        self.read_bodies()
+        self.questions = {card.question: card_id for card_id, card in self.cards.items()}
+        self.bodies_loaded = True
+
+    def read_body(self, card):
+        """
+        Reads one card's question and answer from card_bodies.csv.
+        """
+        with open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv', 'rb') as bodies_file:
+            bodies_file.seek(card.body_offset)
+            row = decode_body(bodies_file.read(card.body_length))
+
+        if row is None or row[0] != str(card.id):
+            self.load_bodies()
+        else:
+            card.question, card.answer = row[1], row[2]
+
+    def read_bodies(self):
+        """
+        Reads every card's question and answer from card_bodies.csv.
+        """
+        with open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv', 'rb') as bodies_file:
+            bodies = bodies_file.read()
+
+        for card in self.cards.values():
+            row = decode_body(bodies[card.body_offset:card.body_offset + card.body_length])
+            if row is None or row[0] != str(card.id):
+                self.recover_bodies()
+                return
+
+            card.question, card.answer = row[1], row[2]
+
+    def recover_bodies(self):
+        """
+        Used if the shards have positions that do not match card_bodies.csv (e.g. the app closed part way through
+        rewriting them). Reads card_bodies.csv row by row, keeping the last row written for each card, and then rewrites
+        it and the shards.
+        """
+        bodies = {}
+
+        with open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv', 'r', newline='') as bodies_file:
+            for row in csv.reader(bodies_file):
+                if len(row) == len(body_fields):
+                    bodies[row[0]] = row
+
+        for card in self.cards.values():
+            card.question, card.answer = bodies.get(str(card.id), ['', '', ''])[1:]
+
+        self.write_bodies()
+        self.write()
+
+    def write_bodies(self):
+        """
+        Rewrites card_bodies.csv with just the rows of the cards held in memory (whose bodies must be loaded). The
+        shards must be rewritten afterwards (by write()), as the cards' positions in card_bodies.csv change.
+        """
+        self.dirty_decks.update(card.deck for card in self.cards.values())
+
+        with self.files_lock:
+            with open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv.new', 'wb') as bodies_file:
+                for card in self.cards.values():
+                    body = encode_body([card.id, card.question, card.answer])
+                    card.body_offset = bodies_file.tell()
+                    card.body_length = len(body)
+                    bodies_file.write(body)
+
+            os.replace(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv.new',
+                       f'{temp_path}\\..\\MemoryGain\\card_bodies.csv')
+
+    def append_bodies(self, cards):
+        """
+        Appends the question and answer of each card to card_bodies.csv, and records where they were written.
+        """
+        with self.files_lock:
+            with open(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv', 'ab') as bodies_file:
+                for card in cards:
+                    body = encode_body([card.id, card.question, card.answer])
+                    card.body_offset = bodies_file.tell()
+                    card.body_length = len(body)
+                    bodies_file.write(body)
+
+    def get_unused_body_size(self):
+        """
+        Returns how many bytes of card_bodies.csv are rows of edited or deleted cards.
+        """
+        if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv'):
+            return 0
+
+        return os.path.getsize(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv') - \
+            sum(card.body_length for card in self.cards.values())
+
+    def write(self):
+        """
+        Rewrites the shards of the decks that have changed, and empties the journals (as the shards now have every
+        change).
+        """
+        self.flush_writes()
+        self.wait_for_compaction()
+
+        unused_body_size = self.get_unused_body_size()
+        if unused_body_size > 0 and unused_body_size * 2 > os.path.getsize(f'{temp_path}\\..\\MemoryGain\\card_bodies.csv'):
+            self.load_bodies()
+            self.write_bodies()
+
+        with self.files_lock:
+            self.write_shards(self.get_dirty_shard_rows(), self.shards)
+
+            for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+                if os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+                    os.remove(f'{temp_path}\\..\\MemoryGain\\{journal}')
+
+            self.journal_length = 0
+
+    def get_dirty_shard_rows(self):
+        """
+        Returns a dict of the rows for each dirty deck's shard (giving new decks a shard), and marks the decks as clean.
+        """
+        shard_rows = {}
+
+        for deck in self.dirty_decks:
+            if deck not in self.shards:
+                self.shards[deck] = f'cards_{self.next_shard}.csv'
+                self.next_shard += 1
+            shard_rows[deck] = []
+
+        for card in self.cards.values():
+            if card.deck in shard_rows:
+                shard_rows[card.deck].append(card.to_shard_row())
+
+        self.dirty_decks = set()
+
+        return shard_rows
+
+    def write_shards(self, shard_rows, shards):
+        """
+        Writes the shards in shard_rows (a dict of deck: rows), and then cards_manifest.csv from shards (so a new deck
+        is only added to the manifest once its shard has been written).
+        """
+        for deck, rows in shard_rows.items():
+            write_shard(shards[deck], rows)
+
+        write_manifest(shards)
+
+    def add_to_journal(self, card):
+        """
+        Queues a card's details to be appended to cards_journal.csv by the writer thread, and starts a compaction if the
+        journal is full.
+        """
+        # The row is made now, as the card may change again before the writer thread gets to it.
+        self.writer.put(card.to_row())
+        self.journal_length += 1
+
+        if self.journal_length >= self.journal_limit:
+            # If a compaction is still running, the journal keeps growing until the next change after it finishes.
+            if self.compaction_thread is None or not self.compaction_thread.is_alive():
+                self.start_compaction()
+
+    def write_batch(self, rows):
+        """
+        Run by the writer thread. Appends rows to cards_journal.csv in one write, and makes sure they are on disk.
+        """
+        # Only the latest row of each card is needed, as it has every change made before it.
+        rows = {row[0]: row for row in rows}.values()
+
+        with self.files_lock:
+            remove_partial_row('cards_journal.csv')
+            with open(f'{temp_path}\\..\\MemoryGain\\cards_journal.csv', 'a', newline='') as journal_file:
+                csv.writer(journal_file).writerows(rows)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def flush_writes(self):
+        """
+        Returns once the writer thread has saved every change it has been given.
+        """
+        self.writer.flush()
+
+    def start_compaction(self):
+        """
+        Rewrites the changed shards in a background thread. The journal is renamed to cards_journal_compacting.csv
+        first, so new changes go to a fresh journal while the shards are being written.
+        """
+        # Any rows still waiting to be saved belong in the journal that is about to be compacted.
+        self.flush_writes()
+        self.wait_for_compaction()
+
+        # If the last compaction failed part way through, its journal is still needed, so the shards are rewritten now
+        # instead.
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards_journal_compacting.csv'):
+            self.write()
+            return
+
+        with self.files_lock:
+            # Rows (and a copy of the manifest) are made now, so the background thread is not affected by changes made
+            # while it runs.
+            shard_rows = self.get_dirty_shard_rows()
+            shards = dict(self.shards)
+            os.replace(f'{temp_path}\\..\\MemoryGain\\cards_journal.csv',
+                       f'{temp_path}\\..\\MemoryGain\\cards_journal_compacting.csv')
+            self.journal_length = 0
+
+        self.compaction_thread = threading.Thread(target=self.compact, args=(shard_rows, shards), daemon=True)
+        self.compaction_thread.start()
+
+    def compact(self, shard_rows, shards):
+        """
+        Run by the compaction thread. Writes the shards, after which the renamed journal is no longer needed.
+        """
+        with self.files_lock:
+            self.write_shards(shard_rows, shards)
+            os.remove(f'{temp_path}\\..\\MemoryGain\\cards_journal_compacting.csv')
+
+    def wait_for_compaction(self):
+        """
+        Returns once any running compaction has finished.
+        """
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+            self.compaction_thread = None
+
+    def delete_journal(self):
+        """
+        Deletes the journals without applying them, for when the card files are about to be replaced (e.g. by a backup).
+        """
+        self.flush_writes()
+        self.wait_for_compaction()
+
+        for journal in ('cards_journal_compacting.csv', 'cards_journal.csv'):
+            if os.path.exists(f'{temp_path}\\..\\MemoryGain\\{journal}'):
+                os.remove(f'{temp_path}\\..\\MemoryGain\\{journal}')
+
+        self.journal_length = 0
+
+    def build_due_index(self):
+        """
+        (Re)builds the due heaps from the cards in memory.
+        """
+        self.due_heap = []
+        self.deck_due_heaps = {}
+        self.due_order = itertools.count()
+
+        for card in self.cards.values():
+            entry = (card.due, next(self.due_order), card.id)
+            self.due_heap.append(entry)
+            self.deck_due_heaps.setdefault(card.deck, []).append(entry)
+
+        heapq.heapify(self.due_heap)
+        for deck_due_heap in self.deck_due_heaps.values():
+            heapq.heapify(deck_due_heap)
+
+    def index_due(self, card):
+        """
+        Pushes a new or changed card onto the due heaps, and updates the due counts.
+        """
+        self.count_due(card)
+
+        entry = (card.due, next(self.due_order), card.id)
+        heapq.heappush(self.due_heap, entry)
+        heapq.heappush(self.deck_due_heaps.setdefault(card.deck, []), entry)
+
+        # Old entries are only thrown away when they reach the top, so the heaps are rebuilt if they get too big.
+        if len(self.due_heap) > 2 * len(self.cards) + 100:
+            self.build_due_index()
+
+    def count_due(self, card):
+        """
+        Counts a new or changed card towards the due counts if it is due before due_cutoff.
+        """
+        self.uncount_due(card.id)
+
+        if card.due < self.due_cutoff:
+            self.due_today[card.id] = card.deck
+            self.due_counts[card.deck] = self.due_counts.get(card.deck, 0) + 1
+
+    def uncount_due(self, card_id):
+        """
+        Takes a card out of the due counts (if it was counted).
+        """
+        deck = self.due_today.pop(card_id, None)
+        if deck is not None:
+            self.due_counts[deck] -= 1
+
+    def count_all_due(self):
+        """
+        (Re)counts the cards due by the end of today.
+        """
+        self.due_cutoff = get_end_of_today()
+        self.due_today = {}
+        self.due_counts = {}
+
+        for card in self.cards.values():
+            self.count_due(card)
+
+    def get_due_cutoff(self):
+        """
+        Returns the timestamp of the end of today. Cards due tomorrow become due at midnight, so everything is recounted
+        once it has passed.
+        """
+        if time.time() >= self.due_cutoff:
+            self.count_all_due()
+
+        return self.due_cutoff
+
+    def get_num_due(self, deck=False):
+        """
+        Returns the number of cards due by the end of today (only from deck, if deck is given).
+        """
+        self.get_due_cutoff()
 
         if deck:
-            for card in cards_today_asc:
-                if card['Deck'] == deck:
-                    card_from_deck = card
-                    break
+            return self.due_counts.get(deck, 0)
 
-        if card_from_deck:
-            return card_from_deck
+        return len(self.due_today)
 
+    def get_most_overdue(self, deck=False):
+        """
+        Returns the card with the earliest due date (only from deck, if deck is given), or None if there are no cards.
+        """
+        if deck:
+            due_heap = self.deck_due_heaps.get(deck, [])
         else:
-            return cards_today_asc[0]
+            due_heap = self.due_heap
+
+        while due_heap:
+            due, order, card_id = due_heap[0]
+            card = self.cards.get(card_id)
+            # Skips entries for cards that have since been deleted, rescheduled or moved to a different deck.
+            if card is not None and card.due == due and ((not deck) or card.deck == deck):
+                return card
+            heapq.heappop(due_heap)
+
+        return None
+
+    def search(self, query):
+        """
+        Returns a list of the cards that match query (see search_query.py). Raises ValueError if the query is not valid.
+        """
+        return search_query.search(self, query)
+
+    def get_text_index(self):
+        """
+        Returns the trigram index of the cards' questions and answers, starting to build it (in a background thread)
+        the first time it is needed. Searches check every card until it is ready.
+        """
+        if self.text_index is None:
+            self.load_bodies()
+            self.text_index = search_index.TrigramIndex(self.cards)
+
+        return self.text_index
+
+    def get_deck_card_ids(self, deck):
+        """
+        Returns a set of IDs that includes every card in deck, from the deck's due heap (which has an entry for every
+        card in the deck, but can also have old entries for cards that have since been moved or deleted).
+        """
+        return {card_id for due, order, card_id in self.deck_due_heaps.get(deck, [])}
+
+    def get_near_duplicate_index(self):
+        """
+        Returns the MinHash index of the cards' questions, starting to build it (in a background thread) the first time
+        it is needed (or by start_near_duplicate_index()).
+        """
+        if self.near_duplicate_index is None:
+            self.load_bodies()
+            self.near_duplicate_index = near_duplicates.MinHashIndex(self.cards)
+
+        return self.near_duplicate_index
+
+    def find_near_duplicates(self, question):
+        """
+        Returns a list of the cards whose question is nearly the same as question (e.g. only differing in whitespace or
+        punctuation), most similar first, or None if the index is still being built.
+        """
+        return self.get_near_duplicate_index().find(question)
+
+    def read_next_id(self):
+        """
+        Returns the stored ID the next new card will be given (0 if none has been stored).
+        """
+        return read_next_card_id()
+
+    def save_next_id(self):
+        """
+        Stores self.next_id, so it is not given out again after the newest cards are deleted. Cards added since it was
+        last stored are in the card files, so it only has to be stored when cards are deleted.
+        """
+        write_next_card_id(self.next_id)
+
+    def new_id(self):
+        """
+        Returns an unused card ID.
+        """
+        card_id = self.next_id
+        self.next_id += 1
+
+        return card_id
+
+    def add(self, card):
+        """
+        Adds a new card (which must already have an ID from new_id()).
+        """
+        self.load_bodies()
+        self.cards[card.id] = card
+        self.questions[card.question] = card.id
+        self.dirty_decks.add(card.deck)
+        self.index_due(card)
+        if self.text_index is not None:
+            self.text_index.add(card)
+        if self.near_duplicate_index is not None:
+            self.near_duplicate_index.add(card)
+        self.save_added(card)
+
+    def add_many(self, cards):
+        """
+        Adds a list of new cards, saving them all at once.
+        """
+        self.load_bodies()
+
+        for card in cards:
+            self.cards[card.id] = card
+            self.questions[card.question] = card.id
+            self.dirty_decks.add(card.deck)
+            self.index_due(card)
+            if self.text_index is not None:
+                self.text_index.add(card)
+            if self.near_duplicate_index is not None:
+                self.near_duplicate_index.add(card)
+
+        self.save_added_many(cards)
+
+    def update(self, card, old_qst=False):
+        """
+        Saves a card that has been changed in memory. old_qst must be given if the card's question or answer was changed.
+        """
+        if old_qst and self.bodies_loaded and old_qst != card.question:
+            del self.questions[old_qst]
+            self.questions[card.question] = card.id
+
+        # Answers and deck moves do not change the text, so it only needs saving (and re-indexing) after an edit.
+        if old_qst:
+            if self.text_index is not None:
+                self.text_index.update(card)
+            if self.near_duplicate_index is not None:
+                self.near_duplicate_index.update(card)
+            self.save_body(card)
+
+        self.dirty_decks.add(card.deck)
+        self.index_due(card)
+        self.save_updated(card)
+
+    def update_many(self, cards):
+        """
+        Saves a list of cards that have been changed in memory (not including their questions or answers) all at once.
+        """
+        for card in cards:
+            self.dirty_decks.add(card.deck)
+            self.index_due(card)
+
+        self.save_updated_many(cards)
+
+    def move(self, cards, new_deck_name):
+        """
+        Moves a list of cards to new_deck_name, saving them all at once.
+        """
+        for card in cards:
+            # The card has to be taken out of its old deck's shard too.
+            self.dirty_decks.add(card.deck)
+            card.deck = new_deck_name
+
+        self.update_many(cards)
+
+    def remove(self, card_id):
+        """
+        Removes a card from memory and the indexes (without saving).
+        """
+        card = self.cards.pop(card_id)
+        self.dirty_decks.add(card.deck)
+        if self.bodies_loaded:
+            self.questions.pop(card.question, None)
+        self.uncount_due(card_id)
+        if self.text_index is not None:
+            self.text_index.delete(card_id)
+        if self.near_duplicate_index is not None:
+            self.near_duplicate_index.delete(card_id)
+
+    def delete_many(self, card_ids):
+        """
+        Deletes the cards with the IDs in card_ids, saving the change once.
+        """
+        for card_id in card_ids:
+            self.remove(card_id)
+
+        self.save_next_id()
+        self.save_deleted_many(card_ids)
+
+    def delete(self, card_id):
+        """
+        Deletes the card with the ID card_id.
+        """
+        self.remove(card_id)
+        self.save_next_id()
+        self.save_deleted(card_id)
+
+    def delete_deck(self, deck):
+        """
+        Deletes all cards in a deck.
+        """
+        self.prepare_deck_change()
+
+        # Deleted in place, as the text index refers to this dict.
+        for card_id in [card_id for card_id, card in self.cards.items() if card.deck == deck]:
+            self.remove(card_id)
+
+        # Its shard is removed rather than rewritten.
+        self.dirty_decks.discard(deck)
+        self.deck_due_heaps.pop(deck, None)
+        self.due_counts.pop(deck, None)
+        self.save_next_id()
+        self.save_deleted_deck(deck)
+
+    def rename_deck(self, old_deck_name, new_deck_name):
+        """
+        Moves all cards in old_deck_name to new_deck_name.
+        """
+        self.prepare_deck_change()
+
+        for card in self.cards.values():
+            if card.deck == old_deck_name:
+                card.deck = new_deck_name
+                self.count_due(card)
+
+        if old_deck_name in self.deck_due_heaps:
+            deck_due_heap = self.deck_due_heaps.pop(old_deck_name) + self.deck_due_heaps.get(new_deck_name, [])
+            heapq.heapify(deck_due_heap)
+            self.deck_due_heaps[new_deck_name] = deck_due_heap
+
+        self.save_renamed_deck(old_deck_name, new_deck_name)
+
+    def prepare_deck_change(self):
+        # The journal names each card's deck, so it is applied to the shards before a deck is deleted or renamed.
+        self.write()
+
+    # The save_ methods write a change that has already been made in memory to the card files (or memorygain.db).
+
+    def save_added(self, card):
+        self.append_bodies([card])
+        self.add_to_journal(card)
+
+    def save_added_many(self, cards):
+        self.append_bodies(cards)
+        # One rewrite of the changed shards, rather than filling the journal up with the new cards.
+        self.write()
+
+    def save_body(self, card):
+        # Saved before the card itself, so a shard never has the position of a row that has not been written.
+        self.append_bodies([card])
+
+    def save_updated(self, card):
+        self.add_to_journal(card)
+
+    def save_updated_many(self, cards):
+        self.write()
+
+    def save_deleted(self, card_id):
+        self.write()
+
+    def save_deleted_many(self, card_ids):
+        self.write()
+
+    def save_deleted_deck(self, deck):
+        self.remove_shard(deck)
+
+    def save_renamed_deck(self, old_deck_name, new_deck_name):
+        if old_deck_name not in self.shards:
+            return
+
+        if new_deck_name in self.shards:
+            # The decks are being merged, so the cards have to be written to new_deck_name's shard.
+            self.dirty_decks.add(new_deck_name)
+            self.write()
+            self.remove_shard(old_deck_name)
+        else:
+            with self.files_lock:
+                self.shards[new_deck_name] = self.shards.pop(old_deck_name)
+                write_manifest(self.shards)
+
+    def remove_shard(self, deck):
+        """
+        Removes a deck from cards_manifest.csv, and then deletes its shard.
+        """
+        shard = self.shards.pop(deck, None)
+        if shard is None:
+            return
 
+        with self.files_lock:
+            write_manifest(self.shards)
+            if os.path.exists(f'{temp_path}\\..\\MemoryGain\\{shard}'):
+                os.remove(f'{temp_path}\\..\\MemoryGain\\{shard}')
 
-def correct_ans(current_card):
+
+class SqliteCardStore(CardStore):
     """
-    Updates the current card in cards.csv when the correct button is pressed. No return.
+    A CardStore that keeps its cards in memorygain.db rather than the card files. Each change only touches the rows it
+    affects (found through the ID and Deck indexes), instead of rewriting every card. Questions and answers are
+    selected by ID when they are needed.
     """
-    if int(current_card['Interval']) >= 1440:
-        stats.add_to_correct_1440()
 
-    cards = []
+    # Opened by the writer thread the first time it saves an answer.
+    writer_connection = None
+
+    insert_sql = (
+        'INSERT INTO cards (ID, Deck, Question, Answer, Ease, Due, Interval, Phase) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+    )
+
+    def read(self):
+        self.cards = {}
+
+        for row in self.get_connection().execute(
+                'SELECT ID, Deck, Ease, Due, Interval, Phase FROM cards ORDER BY rowid'):
+            self.read_row(row)
+
+    def read_body(self, card):
+        card.question, card.answer = database.get_connection().execute(
+            'SELECT Question, Answer FROM cards WHERE ID = ?', (card.id,)
+        ).fetchone()
+
+    def read_bodies(self):
+        for card_id, question, answer in database.get_connection().execute('SELECT ID, Question, Answer FROM cards'):
+            card = self.cards.get(card_id)
+            if card is not None:
+                card.question, card.answer = question, answer
+
+    def write(self):
+        self.load_bodies()
+        connection = self.get_connection()
+
+        with connection:
+            connection.execute('DELETE FROM cards')
+            connection.executemany(self.insert_sql, [self.get_database_row(card) for card in self.cards.values()])
+
+    def get_connection(self):
+        """
+        Returns the connection to memorygain.db, once the writer thread has saved every change it has been given (so
+        changes are saved in the order they were made).
+        """
+        self.flush_writes()
+        return database.get_connection()
+
+    def write_batch(self, rows):
+        """
+        Run by the writer thread, which has its own connection (a connection can only be used by the thread that
+        opened it). Updates the cards in rows in one transaction.
+        """
+        if self.writer_connection is None:
+            self.writer_connection = database.connect()
+
+        # Only the latest row of each card is needed.
+        rows = {row[-1]: row for row in rows}.values()
+
+        with self.writer_connection:
+            self.writer_connection.executemany(
+                'UPDATE cards SET Deck = ?, Ease = ?, Due = ?, Interval = ?, Phase = ? WHERE ID = ?', rows
+            )
+
+    @staticmethod
+    def get_database_row(card):
+        """
+        Returns the values for insert_sql.
+        """
+        return card.id, card.deck, card.question, card.answer, card.ease, card.due, card.interval, card.phase
+
+    def read_next_id(self):
+        row = self.get_connection().execute('SELECT ID FROM next_card_id').fetchone()
+
+        return row[0] if row is not None else 0
+
+    def save_next_id(self):
+        with self.get_connection() as connection:
+            connection.execute('DELETE FROM next_card_id')
+            connection.execute('INSERT INTO next_card_id VALUES (?)', (self.next_id,))
+
+    def save_added(self, card):
+        with self.get_connection() as connection:
+            connection.execute(self.insert_sql, self.get_database_row(card))
+
+    def save_added_many(self, cards):
+        with self.get_connection() as connection:
+            connection.executemany(self.insert_sql, [self.get_database_row(card) for card in cards])
+
+    def save_body(self, card):
+        with self.get_connection() as connection:
+            connection.execute('UPDATE cards SET Question = ?, Answer = ? WHERE ID = ?',
+                               (card.question, card.answer, card.id))
+
+    def save_updated(self, card):
+        self.writer.put((card.deck, card.ease, card.due, card.interval, card.phase, card.id))
+
+    def save_updated_many(self, cards):
+        with self.get_connection() as connection:
+            connection.executemany(
+                'UPDATE cards SET Deck = ?, Ease = ?, Due = ?, Interval = ?, Phase = ? WHERE ID = ?',
+                [(card.deck, card.ease, card.due, card.interval, card.phase, card.id) for card in cards]
+            )
+
+    def save_deleted(self, card_id):
+        with self.get_connection() as connection:
+            connection.execute('DELETE FROM cards WHERE ID = ?', (card_id,))
+
+    def save_deleted_many(self, card_ids):
+        with self.get_connection() as connection:
+            connection.executemany('DELETE FROM cards WHERE ID = ?', [(card_id,) for card_id in card_ids])
+
+    def prepare_deck_change(self):
+        pass
+
+    def save_deleted_deck(self, deck):
+        with self.get_connection() as connection:
+            connection.execute('DELETE FROM cards WHERE Deck = ?', (deck,))
+
+    def save_renamed_deck(self, old_deck_name, new_deck_name):
+        with self.get_connection() as connection:
+            connection.execute('UPDATE cards SET Deck = ? WHERE Deck = ?', (new_deck_name, old_deck_name))
+
+
+# Set by get_card_store() to a CardStore, or a SqliteCardStore if memorygain.db is in use.
+card_store = None
+
+
+def get_card_store():
+    """
+    Returns the CardStore, loading it the first time it is needed.
+    """
+    global card_store
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        # Skips header row.
-        next(dict_reader)
-        for card in dict_reader:
-            cards.append(card)
+    if card_store is None:
+        if database.database_in_use():
+            card_store = SqliteCardStore()
+        else:
+            card_store = CardStore()
 
-    for i in range(len(cards)):
-        if cards[i]['Question'] == current_card['Question']:
-            if cards[i]['Interval'] == '0':
-                cards[i]['Due'] = str(datetime.datetime.now() + datetime.timedelta(minutes=10))
-                cards[i]['Interval'] = '10'
+    if not card_store.loaded:
+        card_store.load()
 
-            elif cards[i]['Interval'] == '10':
-                cards[i]['Due'] = str(datetime.datetime.now() + datetime.timedelta(minutes=1440))
-                cards[i]['Interval'] = '1440'
+    return card_store
 
-            else:
-                if (type(stats.get_retention_1440(30)) == float) and (stats.get_retention_1440(30) >= settings.get_target_retention_rate()):
-                    cards[i]['Ease'] = str(float(cards[i]['Ease']) + 0.1)
-                    if float(cards[i]['Ease']) > 5:
-                        cards[i]['Ease'] = '5.0'
-                    cards[i]['Interval'] = str(int(int(cards[i]['Interval']) * float(cards[i]['Ease'])))
-                    cards[i]['Due'] = str(datetime.datetime.now() + datetime.timedelta(minutes=int(cards[i]['Interval'])))
-                else:
-                    cards[i]['Interval'] = str(int(int(cards[i]['Interval']) * float(cards[i]['Ease'])))
-                    cards[i]['Due'] = str(datetime.datetime.now() + datetime.timedelta(minutes=int(cards[i]['Interval'])))
 
-            # Phase 1 is when first learning.
-            # Phase 2 is when the user clicks correct on the card for the first time or after clicking correct for the
-            # first time, after forgetting.
-            # Phase 3 is when the user clicks correct on card that they have gotten correct on the last viewing.
+def get_num_to_study(deck=False):
+    """
+    Find out how many cards need to be studied today. Returns int. By default will count all cards, however if a deck
+    is specified, it only counts cards due that belong to that deck.
+    """
+    return get_card_store().get_num_due(deck)
+
+
+def del_deck_cards(deck):
+    """
+    Deletes all cards in a deck.
+    """
+    get_card_store().delete_deck(deck)
+
 
-            if cards[i]['Phase'] == '1':
-                cards[i]['Phase'] = '2'
+def get_card(deck=False):
+    """
+    Returns False if no cards are due sometime today. Else it returns a copy of the most overdue card.
+    deck is an optional parameter that specifies the deck to get the card from, if no cards are due in that deck it returns a
+    card from another deck (if one is due, otherwise returns False) (this is done so cards in the same deck are studied together).
+    """
+    store = get_card_store()
+    due_cutoff = store.get_due_cutoff()
 
-            elif cards[i]['Phase'] == '2':
-                cards[i]['Phase'] = '3'
+    if deck:
+        card = store.get_most_overdue(deck)
+        if card is not None and card.due < due_cutoff:
+            store.load_body(card)
+            # A copy is returned so the caller cannot change the stored card.
+            return card.copy()
 
-            elif cards[i]['Phase'] == 'again 1':
-                cards[i]['Phase'] = '2'
+    card = store.get_most_overdue()
+    if card is not None and card.due < due_cutoff:
+        store.load_body(card)
+        return card.copy()
 
-            elif cards[i]['Phase'] == 'again 2':
-                cards[i]['Phase'] = '2'
+    return False
 
-            elif cards[i]['Phase'] == 'again 3':
-                cards[i]['Phase'] = '2'
 
-            # Can break after it finds the card with a matching question as each question is unique.
-            break
+def correct_ans(current_card, latency=None):
+    """
+    Updates the current card in the card store when the correct button is pressed, and records the answer in the
+    review log. latency is how long (in seconds) the card was shown before it was answered, if known. No return.
+    """
+    if current_card.interval >= 1440:
+        stats.add_to_correct_1440()
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
-        dict_writer.writeheader()
-        dict_writer.writerows(cards)
+    store = get_card_store()
+    card = store.cards.get(current_card.id)
+    if card is None:
+        return
+
+    previous_interval, previous_phase = card.interval, card.phase
+
+    if card.interval == 0:
+        card.due = int(time.time()) + 10 * 60
+        card.interval = 10
+
+    elif card.interval == 10:
+        card.due = int(time.time()) + 1440 * 60
+        card.interval = 1440
+
+    else:
+        retention = stats.get_retention_1440(30)
+        if (type(retention) == float) and (retention >= settings.get_target_retention_rate()):
+            card.ease = min(card.ease + 0.1, 5.0)
+        card.interval = int(card.interval * card.ease)
+        card.due = int(time.time()) + card.interval * 60
 
+    # Phase 1 is when first learning.
+    # Phase 2 is when the user clicks correct on the card for the first time or after clicking correct for the
+    # first time, after forgetting.
+    # Phase 3 is when the user clicks correct on card that they have gotten correct on the last viewing.
 
-def again_ans(current_card):
+    if card.phase == '1':
+        card.phase = '2'
+
+    elif card.phase == '2':
+        card.phase = '3'
+
+    elif card.phase == 'again 1':
+        card.phase = '2'
+
+    elif card.phase == 'again 2':
+        card.phase = '2'
+
+    elif card.phase == 'again 3':
+        card.phase = '2'
+
+    store.update(card)
+    review_log.add_review(card.id, 'correct', previous_phase, previous_interval, card.interval, card.ease, latency)
+
+
+def again_ans(current_card, latency=None):
     """
-    Updates the current card in cards.csv when the again button is pressed. No return.
+    Updates the current card in the card store when the again button is pressed, and records the answer in the review
+    log. latency is how long (in seconds) the card was shown before it was answered, if known. No return.
     """
-    if int(current_card['Interval']) >= 1440:
+    if current_card.interval >= 1440:
         stats.add_to_again_1440()
 
-    cards = []
+    store = get_card_store()
+    card = store.cards.get(current_card.id)
+    if card is None:
+        return
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        # Skips header row.
-        next(dict_reader)
-        for card in dict_reader:
-            cards.append(card)
+    previous_interval, previous_phase = card.interval, card.phase
 
-    for i in range(len(cards)):
-        if cards[i]['Question'] == current_card['Question']:
-            if (not cards[i]['Interval'] == '0') and (not cards[i]['Interval'] == '10'):
-                cards[i]['Ease'] = str(float(cards[i]['Ease']) - 0.3)
-                if float(cards[i]['Ease']) < 1.3:
-                    cards[i]['Ease'] = '1.3'
+    if (not card.interval == 0) and (not card.interval == 10):
+        card.ease = max(card.ease - 0.3, 1.3)
 
-            cards[i]['Due'] = str(datetime.datetime.now() + datetime.timedelta(minutes=3))
-            cards[i]['Interval'] = '0'
+    card.due = int(time.time()) + 3 * 60
+    card.interval = 0
 
-            if cards[i]['Phase'] == '1':
-                cards[i]['Phase'] = 'again 1'
+    if card.phase == '1':
+        card.phase = 'again 1'
 
-            elif cards[i]['Phase'] == '2':
-                cards[i]['Phase'] = 'again 2'
+    elif card.phase == '2':
+        card.phase = 'again 2'
 
-            elif cards[i]['Phase'] == '3':
-                cards[i]['Phase'] = 'again 3'
+    elif card.phase == '3':
+        card.phase = 'again 3'
 
-            # Can break after it finds the card with a matching question as each question is unique.
-            break
-
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
-        dict_writer.writeheader()
-        dict_writer.writerows(cards)
+    store.update(card)
+    review_log.add_review(card.id, 'again', previous_phase, previous_interval, card.interval, card.ease, latency)
 
 
 def del_card(current_card):
     """
-    Finds and deletes a card from cards.txt. No return.
+    Deletes a card from the card store. No return.
     """
-    cards = []
+    store = get_card_store()
+    if current_card.id in store.cards:
+        store.delete(current_card.id)
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        # Skips header row.
-        next(dict_reader)
-        for card in dict_reader:
-            # Each question is unique, so this will not ignore multiple cards.
-            if card['Question'] == current_card['Question']:
-                continue
-            cards.append(card)
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
-        dict_writer.writeheader()
-        dict_writer.writerows(cards)
+def del_cards(cards_to_delete):
+    """
+    Deletes a list of cards, rewriting each changed deck's shard once. No return.
+    """
+    del_cards_by_id([card.id for card in cards_to_delete])
 
 
-def write_card_edit_save(current_card, new_qst, new_ans):
+def del_cards_by_id(card_ids):
     """
-    When the save button is clicked from the edit page, this function updates the card in cards.csv.
+    Deletes the cards with the IDs in card_ids, rewriting each changed deck's shard once. No return.
     """
-    cards = []
+    store = get_card_store()
+    card_ids = {card_id for card_id in card_ids if card_id in store.cards}
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        # Skips header row.
-        next(dict_reader)
-        for card in dict_reader:
-            cards.append(card)
+    if card_ids:
+        store.delete_many(card_ids)
 
-        for i in range(len(cards)):
-            if cards[i]['Deck'] == current_card['Deck'] and cards[i]['Question'] == current_card['Question']:
-                cards[i]['Question'] = new_qst
-                cards[i]['Answer'] = new_ans
-                # Can break after it finds the card with a matching deck and question as each deck and question pair is unique.
-                break
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
-        dict_writer.writeheader()
-        dict_writer.writerows(cards)
+def move_cards(cards_to_move, new_deck_name):
+    """
+    Moves a list of cards to new_deck_name, rewriting each changed deck's shard once. No return.
+    """
+    store = get_card_store()
+    cards_moved = []
+
+    for current_card in cards_to_move:
+        card = store.cards.get(current_card.id)
+        if card is not None and card.deck != new_deck_name:
+            cards_moved.append(card)
+
+    if cards_moved:
+        store.move(cards_moved, new_deck_name)
+
+
+def reset_cards(cards_to_reset):
+    """
+    Resets a list of cards to new cards (due now, with the ease factor a new card would get), rewriting each changed
+    deck's shard once. No return.
+    """
+    store = get_card_store()
+    linear_reg = linear_regression.get_linear_reg()
+    cards_reset = []
+
+    for current_card in cards_to_reset:
+        card = store.cards.get(current_card.id)
+        if card is not None:
+            store.load_body(card)
+            card.ease = get_new_ease(linear_reg, card.answer)
+            card.due = int(time.time())
+            card.interval = 0
+            card.phase = '1'
+            cards_reset.append(card)
+
+    if cards_reset:
+        store.update_many(cards_reset)
+
+
+def write_card_edit_save(current_card, new_qst, new_ans):
+    """
+    When the save button is clicked from the edit page, this function updates the card in the card store.
+    """
+    store = get_card_store()
+    card = store.cards.get(current_card.id)
+    if card is None:
+        return
+
+    store.load_body(card)
+    old_qst = card.question
+    card.question = new_qst
+    card.answer = new_ans
+
+    store.update(card, old_qst)
 
 
 def search_for_cards(query):
     """
-    Returns a list of cards with the query.
+    Returns a list of copies of the cards that match query (see search_query.py for the query language). Raises
+    ValueError if the query is not valid.
     """
-    query = query.lower()
-    cards = []
+    store = get_card_store()
+    results = store.search(query)
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        # Skips header row.
-        next(dict_reader)
-        for card in dict_reader:
-            if (query in card['Question'].lower()) or (query in card['Answer'].lower()):
-                cards.append(card)
+    # Queries without text do not load the questions and answers, but the cards returned need them.
+    if any(card.question is None for card in results):
+        store.load_bodies()
 
-    return cards
+    return [card.copy() for card in results]
+
+
+def search_cards(query):
+    """
+    Returns a search_query.SearchCursor, which pages through the cards that match query as they are needed. Raises
+    ValueError if the query is not valid.
+    """
+    return search_query.SearchCursor(get_card_store(), query)
 
 
 def check_qst_exists(qst):
     """
     Checks if a question already exists in a card. Returns True if it does, and returns False if it does not.
     """
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        next(dict_reader)
-        for card in dict_reader:
-            if card['Question'] == qst:
-                return True
+    store = get_card_store()
+    store.load_bodies()
 
-    return False
+    return qst in store.questions
 
 
-def add_card(deck, qst, ans):
+def find_near_duplicates(qst):
     """
-    Appends a card to cards.csv. Return True if successful. Return False is duplicate question
+    Returns a list of copies of the cards whose question is nearly (but not exactly) the same as qst, e.g. only
+    differing in whitespace or punctuation, most similar first. Returns None if they can not be looked for yet, as the
+    index is still being built.
     """
-    if check_qst_exists(qst):
-        return False
+    near_duplicate_cards = get_card_store().find_near_duplicates(qst)
+    if near_duplicate_cards is None:
+        return None
 
-    linear_reg = linear_regression.get_linear_reg()
+    return [card.copy() for card in near_duplicate_cards if card.question != qst]
+
+
+def start_near_duplicate_index():
+    """
+    Starts building the index used to find near duplicates in the background, if they are checked for (see
+    settings.get_check_near_duplicates()), so it is ready by the time a card is added. Called when the app opens and
+    after the cards are reloaded.
+    """
+    if settings.get_check_near_duplicates():
+        get_card_store().get_near_duplicate_index()
+
+
+def get_new_ease(linear_reg, ans):
+    """
+    Returns the ease factor for a new card with the answer ans. linear_reg is the result of
+    linear_regression.get_linear_reg().
+    """
     if linear_reg:
         ef = linear_reg(len(ans))
         # Maximum EF is 5.0. Minimum is 1.3.
         if ef >= 5:
-            card = {
-                'Deck': deck,
-                'Question': qst,
-                'Answer': ans,
-                'Ease': '5.0',
-                'Due': str(datetime.datetime.now()),
-                'Interval': '0',
-                'Phase': '1'
-            }
+            return 5.0
         elif ef <= 1.3:
-            card = {
-                'Deck': deck,
-                'Question': qst,
-                'Answer': ans,
-                'Ease': '1.3',
-                'Due': str(datetime.datetime.now()),
-                'Interval': '0',
-                'Phase': '1'
-            }
+            return 1.3
         else:
-            card = {
-                'Deck': deck,
-                'Question': qst,
-                'Answer': ans,
-                'Ease': str(ef),
-                'Due': str(datetime.datetime.now()),
-                'Interval': '0',
-                'Phase': '1'
-            }
-    else:
-        card = {
-            'Deck': deck,
-            'Question': qst,
-            'Answer': ans,
-            'Ease': '2.5',
-            'Due': str(datetime.datetime.now()),
-            'Interval': '0',
-            'Phase': '1'
-        }
-
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'a', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
-        dict_writer.writerow(card)
+            return ef
+
+    return 2.5
+
+
+def make_card(deck, qst, ans, ease):
+    """
+    Returns a new card, due now.
+    """
+    return Card(get_card_store().new_id(), deck, qst, ans, ease, int(time.time()), 0, '1')
+
+
+def add_card(deck, qst, ans):
+    """
+    Adds a card to the card store. Return True if successful. Return False is duplicate question
+    """
+    if check_qst_exists(qst):
+        return False
+
+    card = make_card(deck, qst, ans, get_new_ease(linear_regression.get_linear_reg(), ans))
+    get_card_store().add(card)
 
     return True
 
 
-def change_deck(old_deck_name, new_deck_name, qst=False):
+def add_cards_bulk(rows):
     """
-    Changes the deck as set of cards belongs to. If qst is not False it will only change the deck of the card with that
-    question (note: each question is unique).
+    Adds many cards at once. rows is an iterable of (deck, question, answer). The linear regression used for the ease
+    factors is only done once, and all the cards are saved together. Returns a list of the rows that were skipped as
+    their question already exists (or appeared earlier in rows).
     """
-    cards_to_update = []
-    cards_not_to_update = []
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'r') as cards_file:
-        dict_reader = csv.DictReader(cards_file, fieldnames=fields)
-        next(dict_reader)
-        if qst:
-            for card in dict_reader:
-                if card['Deck'] == old_deck_name and card['Question'] == qst:
-                    cards_to_update.append(card)
-                else:
-                    cards_not_to_update.append(card)
+    store = get_card_store()
+    store.load_bodies()
+    linear_reg = linear_regression.get_linear_reg()
+
+    new_cards = []
+    new_qsts = set()
+    skipped_rows = []
+
+    for row in rows:
+        deck, qst, ans = row
+        if qst in store.questions or qst in new_qsts:
+            skipped_rows.append(row)
+            continue
+
+        new_qsts.add(qst)
+        new_cards.append(make_card(deck, qst, ans, get_new_ease(linear_reg, ans)))
+
+    if new_cards:
+        store.add_many(new_cards)
+
+    return skipped_rows
+
+
+def import_cards(path, deck, check_near_duplicates=False, is_valid=None):
+    """
+    Adds the cards in a .csv or .tsv file (.tsv files are tab separated) to deck. Each row should be question, answer.
+    Rows with three columns are deck, question, answer instead, and go into that deck (which the caller has to add
+    with decks.add_deck() if it does not exist). Rows without a question are ignored. The file is read as UTF-8 (with or
+    without a byte order mark).
+
+    is_valid is a function that returns False for text that can not be saved (MemoryGain.check_valid_chars()), and rows
+    with a deck, question or answer it rejects are not added.
+
+    Returns (list of rows added, list of rows skipped as duplicates, list of rows added that are near duplicates, list
+    of rows skipped as invalid). The near duplicates (rows whose question is nearly the same as another card's) are
+    only looked for if check_near_duplicates is True, and are None if the index used to find them is still being built.
+    Raises UnicodeDecodeError or csv.Error if the file can not be read, in which case no cards are added.
+    """
+    if path.lower().endswith('.tsv'):
+        delimiter = '\t'
+    else:
+        delimiter = ','
+
+    rows = []
+    invalid_rows = []
+
+    with open(path, 'r', newline='', encoding='utf-8-sig') as import_file:
+        for line in csv.reader(import_file, delimiter=delimiter):
+            line = [field.strip() for field in line]
+
+            if len(line) >= 3:
+                row = (line[0] or deck, line[1], line[2])
+            elif len(line) == 2:
+                row = (deck, line[0], line[1])
+            else:
+                continue
+
+            if row[1] == '' or line[:3] in (['Deck', 'Question', 'Answer'], ['Question', 'Answer']):
+                continue
+
+            if is_valid is not None and not all(is_valid(field) for field in row):
+                invalid_rows.append(row)
+                continue
+
+            rows.append(row)
+
+    skipped_rows = add_cards_bulk(rows)
+    # The skipped rows are the same objects as in rows, so rows that are the same as a skipped row are not mistaken
+    # for it.
+    skipped = {id(row) for row in skipped_rows}
+    added_rows = [row for row in rows if id(row) not in skipped]
+
+    near_duplicate_rows = []
+    if check_near_duplicates and added_rows:
+        # Checked once the cards have been added, so rows that are near duplicates of each other are found too.
+        if get_card_store().get_near_duplicate_index().ready:
+            near_duplicate_rows = [row for row in added_rows if find_near_duplicates(row[1])]
         else:
-            for card in dict_reader:
-                if card['Deck'] == old_deck_name:
-                    cards_to_update.append(card)
-                else:
-                    cards_not_to_update.append(card)
+            near_duplicate_rows = None
 
-    for card in cards_to_update:
-        card['Deck'] = new_deck_name
+    return added_rows, skipped_rows, near_duplicate_rows, invalid_rows
 
-    with open(f'{temp_path}\\..\\MemoryGain\\cards.csv', 'w', newline='') as cards_file:
-        dict_writer = csv.DictWriter(cards_file, fieldnames=fields)
-        dict_writer.writeheader()
-        dict_writer.writerows(cards_to_update)
-        dict_writer.writerows(cards_not_to_update)
+
+def change_deck(old_deck_name, new_deck_name, card_id=False):
+    """
+    Changes the deck as set of cards belongs to. If card_id is not False it will only change the deck of the card with
+    that ID.
+    """
+    store = get_card_store()
+
+    if card_id:
+        card = store.cards.get(card_id)
+        if card is not None and card.deck == old_deck_name and old_deck_name != new_deck_name:
+            store.move([card], new_deck_name)
+    else:
+        store.rename_deck(old_deck_name, new_deck_name)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,190 @@
+"""
+This module is for the optional SQLite backend (memorygain.db). Once memorygain.db exists, cards, decks, stats and
+settings are read from and written to it, instead of the card files, decks.txt, reviews_1440.csv and settings.csv.
+Running this module migrates the existing files into memorygain.db.
+"""
+
+import tempfile
+import os
+import csv
+import sqlite3
+import cards
+import stats
+
+
+temp_path = tempfile.gettempdir()
+# Cached result of database_in_use(), so the file system is not checked on every call.
+in_use = None
+connection = None
+
+card_columns = 'Deck TEXT, Question TEXT, Answer TEXT, Ease REAL, Due INTEGER, Interval INTEGER, Phase TEXT, ID INTEGER'
+
+schema = f'''
+CREATE TABLE IF NOT EXISTS cards ({card_columns});
+CREATE UNIQUE INDEX IF NOT EXISTS cards_question ON cards (Question);
+CREATE INDEX IF NOT EXISTS cards_deck ON cards (Deck);
+CREATE INDEX IF NOT EXISTS cards_due ON cards (Due);
+CREATE TABLE IF NOT EXISTS decks (Name TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS daily_reviews_1440 (
+    Date TEXT PRIMARY KEY, Correct INTEGER DEFAULT 0, Again INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS settings (Name TEXT PRIMARY KEY, Value TEXT);
+CREATE TABLE IF NOT EXISTS next_card_id (ID INTEGER);
+'''
+
+
+def database_in_use():
+    """
+    Returns True if memorygain.db is on the device (so it should be used instead of the csv and txt files), else False.
+    """
+    global in_use
+
+    if in_use is None:
+        in_use = os.path.exists(f'{temp_path}\\..\\MemoryGain\\memorygain.db')
+
+    return in_use
+
+
+def add_card_ids(connection):
+    """
+    Databases made before card IDs were added have no ID column in the cards table. If that is the case, the column is
+    added (giving every card an ID), and indexed.
+    """
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(cards)')]
+
+    with connection:
+        if 'ID' not in columns:
+            connection.execute('ALTER TABLE cards ADD COLUMN ID INTEGER')
+            connection.execute('UPDATE cards SET ID = rowid')
+
+        connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS cards_id ON cards (ID)')
+
+
+def convert_card_columns(connection):
+    """
+    Databases made before the Ease and Interval columns were numbers have them as TEXT, so every card's ease and
+    interval is stored as a string. If that is the case, the cards table is rebuilt with card_columns, converting them.
+    """
+    column_types = {row[1]: row[2] for row in connection.execute('PRAGMA table_info(cards)')}
+
+    if column_types.get('Ease') == 'TEXT' or column_types.get('Interval') == 'TEXT':
+        with connection:
+            connection.execute('ALTER TABLE cards RENAME TO cards_text')
+            connection.execute(f'CREATE TABLE cards ({card_columns})')
+            connection.execute(
+                'INSERT INTO cards (Deck, Question, Answer, Ease, Due, Interval, Phase, ID) '
+                'SELECT Deck, Question, Answer, CAST(Ease AS REAL), Due, CAST(Interval AS INTEGER), Phase, ID '
+                'FROM cards_text ORDER BY rowid'
+            )
+            # Also drops the old table's indexes, which are made again below.
+            connection.execute('DROP TABLE cards_text')
+
+        connection.executescript(schema)
+        add_card_ids(connection)
+
+
+def count_reviews_by_day(connection):
+    """
+    Databases made before results were counted by day have a reviews_1440 table, with a row for every result. If that
+    is the case, the rows are counted into daily_reviews_1440, and the table is dropped.
+    """
+    tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+    if 'reviews_1440' in tables:
+        with connection:
+            connection.execute(
+                "INSERT INTO daily_reviews_1440 (Date, Correct, Again) "
+                "SELECT Date, SUM(Result = 'correct'), SUM(Result = 'again') FROM reviews_1440 WHERE true GROUP BY Date "
+                "ON CONFLICT (Date) DO UPDATE SET Correct = Correct + excluded.Correct, Again = Again + excluded.Again"
+            )
+            connection.execute('DROP TABLE reviews_1440')
+
+
+def connect():
+    """
+    Opens a new connection to memorygain.db. A connection can only be used by the thread that opened it, so this is
+    for threads other than the main one (which uses get_connection()).
+    """
+    return sqlite3.connect(f'{temp_path}\\..\\MemoryGain\\memorygain.db')
+
+
+def get_connection():
+    """
+    Returns the connection to memorygain.db, opening it (and creating any missing tables) the first time it is needed.
+    """
+    global connection
+
+    if connection is None:
+        connection = connect()
+        connection.executescript(schema)
+        add_card_ids(connection)
+        convert_card_columns(connection)
+        count_reviews_by_day(connection)
+
+    return connection
+
+
+def migrate():
+    """
+    Copies the cards, decks.txt, reviews_1440.csv and settings.csv into a new memorygain.db. Returns False if
+    memorygain.db already exists, otherwise returns True. The old files are left in place (they are no longer used once
+    memorygain.db exists).
+    """
+    global in_use
+
+    if os.path.exists(f'{temp_path}\\..\\MemoryGain\\memorygain.db'):
+        return False
+
+    # Built under a temporary name so a failed migration does not leave a half-filled memorygain.db behind.
+    migration_path = f'{temp_path}\\..\\MemoryGain\\memorygain.db.migrating'
+    if os.path.exists(migration_path):
+        os.remove(migration_path)
+
+    migration_connection = sqlite3.connect(migration_path)
+    migration_connection.executescript(schema)
+    add_card_ids(migration_connection)
+
+    with migration_connection:
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards_manifest.csv') or \
+                os.path.exists(f'{temp_path}\\..\\MemoryGain\\cards.csv'):
+            # Copied from the CardStore (which has cards_journal.csv applied), so recent answers and new cards are
+            # migrated too. The eases and intervals are converted from the strings in the card files to numbers.
+            card_store = cards.get_card_store()
+            card_store.load_bodies()
+            migration_connection.executemany(
+                'INSERT OR IGNORE INTO cards (ID, Deck, Question, Answer, Ease, Due, Interval, Phase) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [cards.SqliteCardStore.get_database_row(card) for card in card_store.cards.values()]
+            )
+            migration_connection.execute('INSERT INTO next_card_id VALUES (?)', (card_store.next_id,))
+
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\decks.txt'):
+            with open(f'{temp_path}\\..\\MemoryGain\\decks.txt', 'r') as decks_file:
+                migration_connection.executemany(
+                    'INSERT OR IGNORE INTO decks VALUES (?)',
+                    [(line.replace('\n', ''),) for line in decks_file if line.strip()]
+                )
+
+        # Also migrates correct_dates_1440.txt and again_dates_1440.txt into reviews_1440.csv, if they are still there.
+        stats.stats_on_device()
+        stats.load_daily_results()
+        migration_connection.executemany(
+            'INSERT INTO daily_reviews_1440 VALUES (?, ?, ?)',
+            [(date, correct, again) for date, (correct, again) in stats.daily_results.items()]
+        )
+
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\settings.csv'):
+            with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'r') as settings_file:
+                dict_reader = csv.DictReader(settings_file)
+                for row in dict_reader:
+                    migration_connection.executemany('INSERT OR REPLACE INTO settings VALUES (?, ?)', row.items())
+
+    migration_connection.close()
+    os.replace(migration_path, f'{temp_path}\\..\\MemoryGain\\memorygain.db')
+    in_use = True
+
+    return True
+
+
+if __name__ == '__main__':
+    migrate()
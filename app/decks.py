@@ -6,6 +6,7 @@ import tempfile
 import re
 import os
 import cards
+import database
 
 
 temp_path = tempfile.gettempdir()
@@ -30,6 +31,10 @@ def check_deck_exists(deck):
     """
     Checks if a deck exists. If it does True is returned, if not, False is returned.
     """
+    if database.database_in_use():
+        row = database.get_connection().execute('SELECT 1 FROM decks WHERE Name = ?', (deck,)).fetchone()
+        return row is not None
+
     with open(f'{temp_path}\\..\\MemoryGain\\decks.txt', 'r') as decks_file:
         deck_lines = decks_file.readlines()
         if (deck + '\n') in deck_lines:
@@ -42,6 +47,9 @@ def get_deck_lines():
     """
     Returns a list with all the lines in decks.txt (each line corresponds to a deck).
     """
+    if database.database_in_use():
+        return [row[0] for row in database.get_connection().execute('SELECT Name FROM decks ORDER BY lower(Name), Name')]
+
     with open(f'{temp_path}\\..\\MemoryGain\\decks.txt', 'r') as decks_text:
         lines = decks_text.readlines()
         for i in range(len(lines)):
@@ -53,6 +61,13 @@ def del_deck(deck):
     """
     Deletes a deck from decks.txt and the cards belonging to that deck in cards.txt.
     """
+    if database.database_in_use():
+        with database.get_connection() as connection:
+            connection.execute('DELETE FROM decks WHERE Name = ?', (deck,))
+
+        cards.del_deck_cards(deck)
+        return
+
     with open(f'{temp_path}\\..\\MemoryGain\\decks.txt', 'r') as decks_file:
         deck_lines = decks_file.readlines()
         index = deck_lines.index(deck + '\n')
@@ -71,6 +86,13 @@ def add_deck(deck):
     if check_deck_exists(deck):
         return False
 
+    if database.database_in_use():
+        # Decks are put in alphabetical order when they are read, by get_deck_lines().
+        with database.get_connection() as connection:
+            connection.execute('INSERT INTO decks VALUES (?)', (deck,))
+
+        return True
+
     with open(f'{temp_path}\\..\\MemoryGain\\decks.txt', 'a') as decks_file:
         decks_file.write(deck + '\n')
 
@@ -93,6 +115,13 @@ def rename_deck(old_name, new_name):
     if check_deck_exists(new_name):
         return False
 
+    if database.database_in_use():
+        with database.get_connection() as connection:
+            connection.execute('UPDATE decks SET Name = ? WHERE Name = ?', (new_name, old_name))
+
+        cards.change_deck(old_name, new_name)
+        return True
+
     deck_lines = get_deck_lines()
     for i in range(len(deck_lines)):
         if deck_lines[i] == old_name:
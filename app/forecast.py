@@ -0,0 +1,138 @@
+"""
+Contains the review load forecasts shown on the stats page: how many cards are due on each of the next days, and a
+projection of how many will be reviewed each day if every card is answered correctly when it is due.
+
+The forecasts are worked out from the due dates, intervals and eases of every card at once with NumPy, if it is
+installed. Without it they are counted card by card, which gives the same results but is slower with many cards.
+"""
+
+import cards
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+seconds_per_day = 24 * 60 * 60
+
+
+def get_card_columns():
+    """
+    Returns (deck_names, deck_codes, due, interval, ease) for every card in the card store. deck_names is a list of the
+    decks with cards, and each card's deck is given by its index in deck_names. The other values are lists, or NumPy
+    arrays if NumPy is installed.
+    """
+    store = cards.get_card_store()
+    deck_codes = {}
+    card_list = list(store.cards.values())
+
+    codes = [deck_codes.setdefault(card.deck, len(deck_codes)) for card in card_list]
+    due = [card.due for card in card_list]
+    interval = [card.interval for card in card_list]
+    ease = [card.ease for card in card_list]
+
+    if numpy is not None:
+        codes = numpy.array(codes, dtype=numpy.int64)
+        due = numpy.array(due, dtype=numpy.int64)
+        interval = numpy.array(interval, dtype=numpy.int64)
+        ease = numpy.array(ease, dtype=numpy.float64)
+
+    return list(deck_codes), codes, due, interval, ease
+
+
+def get_due_days(due):
+    """
+    Returns the day each card is due on, where 0 is today (including cards that are overdue), 1 is tomorrow, and so on.
+    due is a NumPy array of timestamps, or a single timestamp.
+    """
+    cutoff = cards.get_card_store().get_due_cutoff()
+
+    if numpy is not None and isinstance(due, numpy.ndarray):
+        return numpy.maximum((due - cutoff) // seconds_per_day + 1, 0)
+
+    return max((due - cutoff) // seconds_per_day + 1, 0)
+
+
+def get_next_interval(interval, ease):
+    """
+    Returns the interval a card will have after it is next answered correctly (the same as cards.correct_ans(), apart
+    from the ease not being raised). interval and ease are NumPy arrays, or single values.
+    """
+    if numpy is not None and isinstance(interval, numpy.ndarray):
+        return numpy.where((interval == 0) | (interval == 10), 1440, (interval * ease).astype(numpy.int64))
+
+    if interval == 0 or interval == 10:
+        return 1440
+
+    return int(interval * ease)
+
+
+def get_due_forecast(days=30):
+    """
+    Returns a dict of deck: list of the number of cards due on each of the next days days (the first being today,
+    including every overdue card). Cards are only counted on the day they are currently due.
+    """
+    deck_names, codes, due, interval, ease = get_card_columns()
+
+    if numpy is None:
+        counts = {deck: [0] * days for deck in deck_names}
+        for code, card_due in zip(codes, due):
+            day = get_due_days(card_due)
+            if day < days:
+                counts[deck_names[code]][day] += 1
+
+        return counts
+
+    due_days = get_due_days(due)
+    in_range = due_days < days
+    # Each deck's days are counted together by giving every (deck, day) pair its own bin.
+    counts = numpy.bincount(codes[in_range] * days + due_days[in_range], minlength=len(deck_names) * days)
+    counts = counts.reshape(len(deck_names), days)
+
+    return {deck: counts[code].tolist() for code, deck in enumerate(deck_names)}
+
+
+def get_projected_reviews(days=30):
+    """
+    Returns a dict of deck: list of the number of cards that will be reviewed on each of the next days days, if every
+    card is answered correctly on the day it is due. Unlike get_due_forecast(), a card is counted again each time it
+    comes back within the days (each card is only counted once a day, as the 10 minute learning step is on the same
+    day). The eases are not raised, so the projection is slightly more than the reviews needed if retention stays high.
+    """
+    deck_names, codes, due, interval, ease = get_card_columns()
+
+    if numpy is None:
+        counts = {deck: [0] * days for deck in deck_names}
+        for code, card_due, card_interval, card_ease in zip(codes, due, interval, ease):
+            day = get_due_days(card_due)
+            while day < days:
+                counts[deck_names[code]][day] += 1
+                card_interval = get_next_interval(card_interval, card_ease)
+                day += max(card_interval // 1440, 1)
+
+        return counts
+
+    counts = numpy.zeros((len(deck_names), days), dtype=numpy.int64)
+    due_days = get_due_days(due)
+
+    # Every card reviewed on a day is moved on to its next due day at once, so there is one pass per day rather than
+    # one per review.
+    for day in range(days):
+        reviewed = numpy.flatnonzero(due_days == day)
+        if not reviewed.size:
+            continue
+
+        counts[:, day] = numpy.bincount(codes[reviewed], minlength=len(deck_names))
+        interval[reviewed] = get_next_interval(interval[reviewed], ease[reviewed])
+        due_days[reviewed] += numpy.maximum(interval[reviewed] // 1440, 1)
+
+    return {deck: counts[code].tolist() for code, deck in enumerate(deck_names)}
+
+
+def get_totals(deck_counts, days):
+    """
+    Returns the list of each day's count over every deck, from a dict returned by get_due_forecast() or
+    get_projected_reviews().
+    """
+    return [sum(counts[day] for counts in deck_counts.values()) for day in range(days)]
@@ -59,13 +59,22 @@ def get_linear_reg():
     x_chars = []
     y_ease_factors = []
 
-    cards_var = cards.search_for_cards('')
+    # The cards are read straight from the CardStore, rather than copied by search_for_cards('').
+    store = cards.get_card_store()
+    cards_var = store.cards.values()
     if len(cards_var) <= 100:
         return False
 
+    store.load_bodies()
+
     for card in cards_var:
-        x_chars.append(len(card['Answer']))
-        y_ease_factors.append(float(card['Ease']))
+        x_chars.append(len(card.answer))
+        y_ease_factors.append(card.ease)
+
+    # If every card has the same character count or ease factor (e.g. after importing many new cards), there is no
+    # relationship to find (and the correlation coefficient would divide by 0).
+    if get_sample_std_dev(x_chars) == 0 or get_sample_std_dev(y_ease_factors) == 0:
+        return False
 
     if get_pearson_correlation_coefficient(x_chars, y_ease_factors) > 0:
         return False
@@ -0,0 +1,146 @@
+"""
+Contains the MinHash index used to find cards with nearly the same question (e.g. differing only in whitespace,
+punctuation or a word or two) without comparing the question to every card.
+"""
+
+import re
+import hashlib
+import functools
+import background_index
+
+
+# Each signature has bands * rows_per_band values. Two questions whose shingles have a Jaccard similarity of s share at
+# least one band with a probability of 1 - (1 - s ** rows_per_band) ** bands, which is about 0.99 when s is 0.8, 0.89
+# when s is 0.7 and 0.06 when s is 0.3.
+bands = 8
+rows_per_band = 4
+# The Jaccard similarity of two questions' shingles needed for them to count as near duplicates.
+threshold = 0.7
+
+
+def normalize(text):
+    """
+    Returns text in lowercase, with each run of whitespace and punctuation replaced by a single space.
+    """
+    return re.sub(r'[\W_]+', ' ', text.lower()).strip()
+
+
+def get_shingles(text):
+    """
+    Returns the set of 3 character substrings of text once it has been normalized (or the normalized text itself, if it
+    is shorter than that).
+    """
+    text = normalize(text)
+    if len(text) < 3:
+        return {text}
+
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@functools.lru_cache(maxsize=65536)
+def hash_shingle(shingle):
+    """
+    Returns bands * rows_per_band independent 32 bit hashes of a shingle (the same shingles turn up in many questions,
+    so they are cached).
+    """
+    digest = hashlib.shake_128(shingle.encode()).digest(4 * bands * rows_per_band)
+
+    return tuple(int.from_bytes(digest[i:i + 4], 'little') for i in range(0, len(digest), 4))
+
+
+def get_signature(shingles):
+    """
+    Returns the MinHash signature of a set of shingles: the smallest value of each hash over all the shingles.
+    """
+    return tuple(map(min, zip(*map(hash_shingle, shingles))))
+
+
+def get_similarity(shingles, other_shingles):
+    """
+    Returns the Jaccard similarity of two sets of shingles.
+    """
+    return len(shingles & other_shingles) / len(shingles | other_shingles)
+
+
+class MinHashIndex(background_index.BackgroundIndex):
+    """
+    Maps each band of every card's question signature to the IDs of the cards with that band. Questions that are
+    nearly the same are very likely to share a band, so only the cards sharing a band with a question have to be
+    compared with it.
+
+    Unlike the trigram index, entries are removed as soon as a card is changed or deleted, as each card's signature is
+    kept. The index is built in a background thread (see background_index.py), and find() returns None until it is
+    ready.
+    """
+
+    def __init__(self, cards):
+        self.buckets = {}
+        self.signatures = {}
+        super().__init__(cards)
+
+    def get_bands(self, signature):
+        """
+        Returns the keys of the buckets for a signature.
+        """
+        return [(band, signature[band * rows_per_band:(band + 1) * rows_per_band]) for band in range(bands)]
+
+    def get_item(self, card):
+        return card.question
+
+    def build(self, items):
+        buckets = {}
+        signatures = {}
+
+        for card_id, question in items:
+            signature = get_signature(get_shingles(question))
+            signatures[card_id] = signature
+            for key in self.get_bands(signature):
+                buckets.setdefault(key, set()).add(card_id)
+
+        return buckets, signatures
+
+    def install(self, built):
+        self.buckets, self.signatures = built
+
+    def apply(self, card_id, item):
+        signature = self.signatures.pop(card_id, None)
+        if signature is not None:
+            for key in self.get_bands(signature):
+                bucket = self.buckets[key]
+                bucket.discard(card_id)
+                if not bucket:
+                    del self.buckets[key]
+
+        if item is not None:
+            signature = get_signature(get_shingles(item))
+            self.signatures[card_id] = signature
+            for key in self.get_bands(signature):
+                self.buckets.setdefault(key, set()).add(card_id)
+
+    def find(self, question):
+        """
+        Returns a list of the cards whose question is nearly the same as question, most similar first, or None if the
+        index is not ready yet.
+        """
+        shingles = get_shingles(question)
+        candidates = set()
+
+        with self.lock:
+            if not self.ready:
+                return None
+
+            for key in self.get_bands(get_signature(shingles)):
+                candidates.update(self.buckets.get(key, ()))
+
+        results = []
+        for card_id in candidates:
+            card = self.cards.get(card_id)
+            # Checks the questions really are similar, as a shared band can be a coincidence.
+            if card is not None:
+                similarity = get_similarity(shingles, get_shingles(card.question))
+                if similarity >= threshold:
+                    results.append((similarity, card))
+
+        results.sort(key=lambda result: result[0], reverse=True)
+
+        return [card for similarity, card in results]
@@ -0,0 +1,137 @@
+"""
+This module is for review_log.bin, which has a record of every answer given (for any interval). Each record is the same
+size, so the file can be memory-mapped and read (or indexed into) without parsing any text.
+"""
+
+import tempfile
+import os
+import mmap
+import struct
+import time
+import writer
+
+
+temp_path = tempfile.gettempdir()
+# Each record is (in this order, little-endian, 32 bytes):
+#   card ID (uint32), timestamp in seconds (int64), grade (uint8, see grades), phase before the answer (uint8, index in
+#   phases), 2 bytes of padding, interval before the answer in minutes (uint32), interval after it (uint32), ease after
+#   it (float32), latency in milliseconds from the card being shown to it being answered (uint32, no_latency if unknown).
+# With NumPy, numpy.dtype([('id', '<u4'), ('time', '<i8'), ('grade', 'u1'), ('phase', 'u1'), ('pad', 'V2'),
+# ('previous_interval', '<u4'), ('interval', '<u4'), ('ease', '<f4'), ('latency', '<u4')]) is the same layout.
+record_struct = struct.Struct('<IqBBxxIIfI')
+grades = ['again', 'correct']
+phases = ['1', '2', '3', 'again 1', 'again 2', 'again 3']
+unknown_phase = 255
+no_latency = 2 ** 32 - 1
+max_interval = 2 ** 32 - 1
+
+
+def make_record(card_id, timestamp, grade, phase, previous_interval, interval, ease, latency=None):
+    """
+    Returns the bytes of one record. grade is 'correct' or 'again', and latency is in seconds (or None).
+    """
+    if latency is None:
+        latency = no_latency
+    else:
+        latency = min(int(latency * 1000), no_latency - 1)
+
+    return record_struct.pack(
+        card_id, int(timestamp), grades.index(grade), phases.index(phase) if phase in phases else unknown_phase,
+        min(previous_interval, max_interval), min(interval, max_interval), ease, latency
+    )
+
+
+def write_records(records):
+    """
+    Run by the writer thread. Appends records to review_log.bin in one write.
+    """
+    log_path = f'{temp_path}\\..\\MemoryGain\\review_log.bin'
+
+    with open(log_path, 'ab') as log_file:
+        # If the app closed part way through writing a record, the partial record is removed so the records after it
+        # line up.
+        size = log_file.tell()
+        if size % record_struct.size:
+            log_file.truncate(size - size % record_struct.size)
+            log_file.seek(0, os.SEEK_END)
+
+        log_file.write(b''.join(records))
+
+
+# Records are written in the background, so answering a card does not wait for the disk.
+log_writer = writer.BackgroundWriter(write_records)
+
+
+def add_review(card_id, grade, phase, previous_interval, interval, ease, latency=None):
+    """
+    Records an answer. phase is the card's phase before the answer, and latency is how long (in seconds) the card was
+    shown for before it was answered.
+    """
+    log_writer.put(make_record(card_id, time.time(), grade, phase, previous_interval, interval, ease, latency))
+
+
+def flush():
+    """
+    Returns once every answer recorded has been written to review_log.bin.
+    """
+    log_writer.flush()
+
+
+def get_num_records():
+    """
+    Returns the number of records in review_log.bin.
+    """
+    flush()
+
+    if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\review_log.bin'):
+        return 0
+
+    return os.path.getsize(f'{temp_path}\\..\\MemoryGain\\review_log.bin') // record_struct.size
+
+
+def iter_records(start=0):
+    """
+    Yields each record from index start onwards as a tuple of (card ID, timestamp, grade, phase, previous interval,
+    interval, ease, latency). grade and phase are the strings from grades and phases (phase is None if unknown), and
+    latency is in seconds (or None). The file is memory-mapped, so only the pages that are read are loaded.
+    """
+    num_records = get_num_records()
+    if num_records <= start:
+        return
+
+    with open(f'{temp_path}\\..\\MemoryGain\\review_log.bin', 'rb') as log_file:
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            data = memoryview(log_map)[start * record_struct.size:num_records * record_struct.size]
+
+            try:
+                for card_id, timestamp, grade, phase, previous_interval, interval, ease, latency in \
+                        record_struct.iter_unpack(data):
+                    yield (card_id, timestamp, grades[grade], phases[phase] if phase < len(phases) else None,
+                           previous_interval, interval, ease, None if latency == no_latency else latency / 1000)
+            finally:
+                # The map can not be closed while a view of it exists.
+                data.release()
+
+
+def find_first_record(timestamp):
+    """
+    Returns the index of the first record given at or after timestamp (or the number of records, if there are none).
+    Records are appended as answers are given, so they are in time order and the index is found by a binary search
+    rather than reading every record. (If the clock was put back, records from around then may be out of order.)
+    """
+    num_records = get_num_records()
+    if num_records == 0:
+        return 0
+
+    with open(f'{temp_path}\\..\\MemoryGain\\review_log.bin', 'rb') as log_file:
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            low, high = 0, num_records
+            while low < high:
+                middle = (low + high) // 2
+                # The timestamp is the second field, straight after the 4 byte card ID.
+                if struct.unpack_from('<q', log_map, middle * record_struct.size + 4)[0] < timestamp:
+                    low = middle + 1
+                else:
+                    high = middle
+
+    return low
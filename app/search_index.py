@@ -0,0 +1,114 @@
+"""
+Contains the trigram index used to search the questions and answers of cards without checking every card.
+"""
+
+import array
+import bisect
+import collections
+import background_index
+
+
+def get_trigrams(text):
+    """
+    Returns a set of every 3 character substring of text.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def contains(postings, card_id):
+    """
+    Returns True if the sorted postings array has card_id.
+    """
+    index = bisect.bisect_left(postings, card_id)
+
+    return index < len(postings) and postings[index] == card_id
+
+
+class TrigramIndex(background_index.BackgroundIndex):
+    """
+    Maps every trigram in a card's (lowercase) question and answer to the IDs of the cards that contain it. A
+    query of 3 or more characters can only be in a card that has all of the query's trigrams, so only those cards have
+    to be checked.
+
+    Each trigram's IDs are kept in a sorted array of 32 bit integers rather than a set, which takes a fraction of the
+    memory with many cards. The index is built in a background thread (see background_index.py), and get_candidates()
+    returns None until it is ready.
+
+    Entries are never removed when a card is changed or deleted. The card is simply indexed again, and entries that no
+    longer match are filtered out when searching. The index is rebuilt once there are as many of these stale cards as
+    there are cards.
+    """
+
+    def __init__(self, cards):
+        self.postings = {}
+        self.stale = 0
+        super().__init__(cards)
+
+    def get_item(self, card):
+        return card.question, card.answer
+
+    def build(self, items):
+        postings = collections.defaultdict(lambda: array.array('I'))
+
+        # Added in ID order, so each array is already sorted.
+        for card_id, (question, answer) in sorted(items):
+            for trigram in get_trigrams(question.lower()) | get_trigrams(answer.lower()):
+                postings[trigram].append(card_id)
+
+        return dict(postings)
+
+    def install(self, built):
+        self.postings = built
+        self.stale = 0
+
+    def apply(self, card_id, item):
+        if item is None:
+            return
+
+        for trigram in get_trigrams(item[0].lower()) | get_trigrams(item[1].lower()):
+            trigram_postings = self.postings.setdefault(trigram, array.array('I'))
+            # New cards have the highest ID, so are normally added to the end.
+            if not trigram_postings or trigram_postings[-1] < card_id:
+                trigram_postings.append(card_id)
+            elif not contains(trigram_postings, card_id):
+                trigram_postings.insert(bisect.bisect_left(trigram_postings, card_id), card_id)
+
+    def update(self, card):
+        super().update(card)
+        self.add_stale()
+
+    def delete(self, card_id):
+        super().delete(card_id)
+        self.add_stale()
+
+    def add_stale(self):
+        """
+        Counts a changed or deleted card, and starts rebuilding the index once there are more of them than cards.
+        """
+        with self.lock:
+            self.stale += 1
+            rebuild = self.ready and self.stale > len(self.cards)
+
+        if rebuild:
+            self.start_build()
+
+    def get_candidates(self, query):
+        """
+        Returns the set of IDs of the cards that have every trigram of query (which must be lowercase and at least 3
+        characters long), or None if the index is not ready yet. Every card containing query is in the set, but the
+        set can also have cards that do not.
+        """
+        with self.lock:
+            if not self.ready:
+                return None
+
+            posting_arrays = sorted((self.postings.get(trigram, array.array('I')) for trigram in get_trigrams(query)),
+                                    key=len)
+            # Starts from the fewest cards, and looks each one up in the other arrays.
+            candidates = [card_id for card_id in posting_arrays[0] if card_id in self.cards]
+            for trigram_postings in posting_arrays[1:]:
+                if not candidates:
+                    break
+                candidates = [card_id for card_id in candidates if contains(trigram_postings, card_id)]
+
+        return set(candidates)
@@ -0,0 +1,311 @@
+"""
+Contains the search query language. A query is a list of terms separated by spaces, and a card is found if it matches
+every term:
+
+    word            the question or answer contains word (case-insensitive)
+    "some words"    the question or answer contains the phrase
+    /pattern/       the question or answer matches the regular expression (case-insensitive)
+    deck:name       the card is in the deck (deck:"name with spaces" for names with spaces)
+    ease<2          the card's ease compares to the number (<, <=, >, >=, = or !=)
+    interval>=1440  the card's interval (in minutes) compares to the number
+    due:today       the card is due by the end of today (due:N for the end of the day N days from today, due:overdue
+                    for cards already due)
+    phase:again     the card is in an again phase (phase:1, phase:2 etc. for an exact phase)
+
+A term starting with - finds the cards that do not match it. An empty query finds every card.
+"""
+
+import re
+import time
+import functools
+
+
+token_pattern = re.compile(r'(-?)(?:([a-z]+)(:|<=|>=|!=|<|>|=))?(?:"([^"]*)"|/((?:\\.|[^/\\])+)/|(\S+))', re.IGNORECASE)
+comparisons = {
+    '<': lambda value, number: value < number,
+    '<=': lambda value, number: value <= number,
+    '>': lambda value, number: value > number,
+    '>=': lambda value, number: value >= number,
+    '=': lambda value, number: value == number,
+    ':': lambda value, number: value == number,
+    '!=': lambda value, number: value != number,
+}
+
+
+@functools.lru_cache(maxsize=128)
+def compile_regex(pattern):
+    """
+    Returns the compiled (case-insensitive) regular expression. Cached, as the same searches are often run again.
+    """
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as error:
+        raise ValueError(f'Invalid regular expression /{pattern}/: {error}')
+
+
+class Term:
+    """
+    One term of a query. field is 'text', 'regex', 'deck', 'ease', 'interval', 'due' or 'phase'.
+    """
+
+    def __init__(self, field, operator, value, negated):
+        self.field = field
+        self.operator = operator
+        self.value = value
+        self.negated = negated
+
+        if field in ('ease', 'interval'):
+            if operator not in comparisons:
+                raise ValueError(f'{field} must be followed by <, <=, >, >=, = or != and a number')
+            try:
+                self.number = float(value)
+            except ValueError:
+                raise ValueError(f'{field}{operator}{value} does not compare {field} to a number')
+
+        elif field == 'due':
+            if value == 'today':
+                self.days = 0
+            elif value == 'overdue':
+                self.days = None
+            elif value.isdigit():
+                self.days = int(value)
+            else:
+                raise ValueError(f'due:{value} must be due:today, due:overdue or due: followed by a number of days')
+
+        elif field == 'regex':
+            self.regex = compile_regex(value)
+
+        elif field == 'text':
+            self.value = value.lower()
+
+    def get_candidates(self, store):
+        """
+        Returns a set of IDs of cards that includes every card matching this term, using one of the store's indexes, or
+        None if there is no index for this term (so every card has to be checked).
+        """
+        if self.negated:
+            return None
+
+        if self.field == 'deck':
+            return store.get_deck_card_ids(self.value)
+
+        if self.field == 'due' and self.days == 0:
+            store.get_due_cutoff()
+            return set(store.due_today)
+
+        if self.field == 'text' and len(self.value) >= 3:
+            return store.get_text_index().get_candidates(self.value)
+
+        return None
+
+    def matches(self, card, store):
+        """
+        Returns True if the card matches this term.
+        """
+        return self.check(card, store) != self.negated
+
+    def check(self, card, store):
+        """
+        Returns True if the card matches this term, ignoring negated.
+        """
+        if self.field == 'text':
+            return (self.value in card.question.lower()) or (self.value in card.answer.lower())
+
+        if self.field == 'regex':
+            return bool(self.regex.search(card.question) or self.regex.search(card.answer))
+
+        if self.field == 'deck':
+            return card.deck == self.value
+
+        if self.field == 'ease':
+            return comparisons[self.operator](card.ease, self.number)
+
+        if self.field == 'interval':
+            return comparisons[self.operator](card.interval, self.number)
+
+        if self.field == 'due':
+            if self.days is None:
+                return card.due <= time.time()
+            return card.due < store.get_due_cutoff() + self.days * 24 * 60 * 60
+
+        if self.field == 'phase':
+            if self.value.lower() == 'again':
+                return card.phase.startswith('again')
+            return card.phase == self.value.lower()
+
+
+def parse(query):
+    """
+    Returns the list of Terms in query. Raises ValueError if the query is not valid.
+    """
+    terms = []
+
+    for match in token_pattern.finditer(query):
+        negated, field, operator, phrase, pattern, word = match.groups()
+        negated = negated == '-'
+        field = field.lower() if field else None
+        value = phrase if phrase is not None else word
+
+        if pattern is not None:
+            if field is not None:
+                raise ValueError(f'{field}{operator} can not be followed by a regular expression')
+            terms.append(Term('regex', None, pattern, negated))
+
+        elif field in ('deck', 'phase', 'due') and operator == ':':
+            terms.append(Term(field, operator, value, negated))
+
+        elif field in ('ease', 'interval'):
+            terms.append(Term(field, operator, value, negated))
+
+        elif field is not None:
+            # Not a field (e.g. "note:" in the text), so it is searched for as it is.
+            terms.append(Term('text', None, match.group(0)[len(match.group(1)):], negated))
+
+        elif value:
+            terms.append(Term('text', None, value, negated))
+
+    return terms
+
+
+def get_candidate_ids(store, terms):
+    """
+    Returns a sorted list of the IDs of the cards that have to be checked against terms.
+
+    The terms that can use an index (deck:, due:today and text of 3 or more characters) each narrow the cards down to a
+    set of candidates, and the smallest sets are intersected first. If no term can use an index, every card is checked.
+    """
+    if any(term.field in ('text', 'regex') for term in terms):
+        store.load_bodies()
+
+    candidate_sets = [candidates for candidates in (term.get_candidates(store) for term in terms) if candidates is not None]
+
+    if not candidate_sets:
+        return sorted(store.cards)
+
+    candidate_sets.sort(key=len)
+    candidates = set(candidate_sets[0])
+    for candidate_set in candidate_sets[1:]:
+        if not candidates:
+            break
+        candidates &= candidate_set
+
+    # Sorted by ID, which is the order the cards were added in.
+    return sorted(candidates)
+
+
+def iter_matches(store, terms):
+    """
+    Yields the cards in store that match every term, in the order they were added. Each card is only checked when the
+    next result is needed.
+    """
+    for card_id in get_candidate_ids(store, terms):
+        card = store.cards.get(card_id)
+        if card is not None and all(term.matches(card, store) for term in terms):
+            yield card
+
+
+def search(store, query):
+    """
+    Returns a list of the cards in store that match every term in query, in the order they were added. Raises
+    ValueError if the query is not valid.
+    """
+    return list(iter_matches(store, parse(query)))
+
+
+class SearchCursor:
+    """
+    Pages through the cards that match a query, without finding every result or copying every card found up front.
+    Results are only looked for as far as they are needed, and only the IDs of the cards found are kept, along with
+    copies (with their questions and answers) of the page_size cards on the current page.
+    """
+
+    page_size = 50
+
+    def __init__(self, store, query):
+        """
+        Raises ValueError if the query is not valid.
+        """
+        self.store = store
+        self.terms = parse(query)
+        self.matches = iter_matches(store, self.terms)
+        self.card_ids = []
+        self.page_number = None
+        self.page = []
+
+    def find(self, number):
+        """
+        Finds results until number have been found, or there are no more.
+        """
+        while self.matches is not None and len(self.card_ids) < number:
+            card = next(self.matches, None)
+            if card is None:
+                self.matches = None
+            else:
+                self.card_ids.append(card.id)
+
+    def has_index(self, index):
+        """
+        Returns True if there is a result at index, else False.
+        """
+        self.find(index + 1)
+
+        return index < len(self.card_ids)
+
+    def exists(self):
+        """
+        Returns True if any card matches the query (only looking as far as the first match), else False.
+        """
+        return self.has_index(0)
+
+    def count(self):
+        """
+        Returns the number of cards that match the query. Only the IDs of the results are kept, so no cards are copied.
+        """
+        if not self.terms:
+            # Every card matches an empty query.
+            return len(self.store.cards)
+
+        self.find(float('inf'))
+
+        return len(self.card_ids)
+
+    def get_card_ids(self):
+        """
+        Returns a list of the IDs of every card that matches the query.
+        """
+        self.find(float('inf'))
+
+        return list(self.card_ids)
+
+    def get(self, index):
+        """
+        Returns a copy of the card at index (or None if it has since been deleted). The page the card is on is fetched
+        if it is not the current page. The copy is kept until the page changes, so changes made to it are seen by later
+        calls.
+        """
+        page_number = index // self.page_size
+
+        if page_number != self.page_number:
+            start = page_number * self.page_size
+            self.find(start + self.page_size)
+            self.page = []
+
+            for card_id in self.card_ids[start:start + self.page_size]:
+                card = self.store.cards.get(card_id)
+                if card is None:
+                    self.page.append(None)
+                else:
+                    self.store.load_body(card)
+                    self.page.append(card.copy())
+
+            self.page_number = page_number
+
+        return self.page[index % self.page_size]
+
+    def remove(self, index):
+        """
+        Removes the result at index (e.g. once the card has been deleted).
+        """
+        del self.card_ids[index]
+        # The results after it move back one, so the current page is fetched again when it is next needed.
+        self.page_number = None
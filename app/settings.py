@@ -5,10 +5,11 @@ This module is used for accessing and manipulating settings.csv.
 import tempfile
 import os
 import csv
+import database
 
 
 temp_path = tempfile.gettempdir()
-fields = ['Font Size', 'Target Retention Rate']
+fields = ['Font Size', 'Target Retention Rate', 'Check Near Duplicates']
 
 
 def settings_on_device():
@@ -22,13 +23,16 @@ def settings_on_device():
         with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'w', newline='') as settings_file:
             writer = csv.writer(settings_file)
             writer.writerow(fields)
-            writer.writerow(['10', '90'])
+            writer.writerow(['10', '90', '0'])
 
 
 def get_target_retention_rate():
     """
     Returns the target retention rate specified in settings.csv as an int.
     """
+    if database.database_in_use():
+        return int(get_database_setting('Target Retention Rate', '90'))
+
     with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'r') as settings_file:
         dict_reader = csv.DictReader(settings_file, fieldnames=fields)
         next(dict_reader)
@@ -40,28 +44,43 @@ def set_target_retention_rate(target_retention_rate):
     """
     Change the target retention rate in settings.csv.
     """
+    if database.database_in_use():
+        set_database_setting('Target Retention Rate', target_retention_rate)
+        return
+
     font_size = get_font_size()
+    check_near_duplicates = int(get_check_near_duplicates())
     with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'w', newline='') as settings_file:
         dict_writer = csv.DictWriter(settings_file, fieldnames=fields)
         dict_writer.writeheader()
-        dict_writer.writerow({'Font Size': f'{font_size}', 'Target Retention Rate': f'{target_retention_rate}'})
+        dict_writer.writerow({'Font Size': f'{font_size}', 'Target Retention Rate': f'{target_retention_rate}',
+                              'Check Near Duplicates': f'{check_near_duplicates}'})
 
 
 def set_font_size(font_size):
     """
     Change font size in settings.csv.
     """
+    if database.database_in_use():
+        set_database_setting('Font Size', font_size)
+        return
+
     target_retention_rate = get_target_retention_rate()
+    check_near_duplicates = int(get_check_near_duplicates())
     with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'w', newline='') as settings_file:
         dict_writer = csv.DictWriter(settings_file, fieldnames=fields)
         dict_writer.writeheader()
-        dict_writer.writerow({'Font Size': f'{font_size}', 'Target Retention Rate': f'{target_retention_rate}'})
+        dict_writer.writerow({'Font Size': f'{font_size}', 'Target Retention Rate': f'{target_retention_rate}',
+                              'Check Near Duplicates': f'{check_near_duplicates}'})
 
 
 def get_font_size():
     """
     Returns the font size specified in settings.csv as an int.
     """
+    if database.database_in_use():
+        return int(get_database_setting('Font Size', '10'))
+
     with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'r') as settings_file:
         dict_reader = csv.DictReader(settings_file, fieldnames=fields)
         next(dict_reader)
@@ -69,12 +88,54 @@ def get_font_size():
             return int(row['Font Size'])
 
 
+def get_check_near_duplicates():
+    """
+    Returns True if new cards are checked for questions nearly the same as another card's, else False. Off unless it has
+    been turned on (settings.csv made before this setting was added does not have it).
+    """
+    if database.database_in_use():
+        return get_database_setting('Check Near Duplicates', '0') == '1'
+
+    with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'r') as settings_file:
+        dict_reader = csv.DictReader(settings_file, fieldnames=fields)
+        next(dict_reader)
+        for row in dict_reader:
+            return row['Check Near Duplicates'] == '1'
 
+    return False
 
 
+def set_check_near_duplicates(check_near_duplicates):
+    """
+    Turns checking new cards for near duplicates on (True) or off (False).
+    """
+    if database.database_in_use():
+        set_database_setting('Check Near Duplicates', int(check_near_duplicates))
+        return
 
+    font_size = get_font_size()
+    target_retention_rate = get_target_retention_rate()
+    with open(f'{temp_path}\\..\\MemoryGain\\settings.csv', 'w', newline='') as settings_file:
+        dict_writer = csv.DictWriter(settings_file, fieldnames=fields)
+        dict_writer.writeheader()
+        dict_writer.writerow({'Font Size': f'{font_size}', 'Target Retention Rate': f'{target_retention_rate}',
+                              'Check Near Duplicates': f'{int(check_near_duplicates)}'})
 
 
+def get_database_setting(name, default):
+    """
+    Returns the value of a setting stored in memorygain.db, or default if it has not been set.
+    """
+    row = database.get_connection().execute('SELECT Value FROM settings WHERE Name = ?', (name,)).fetchone()
+    if row is None:
+        return default
 
+    return row[0]
 
 
+def set_database_setting(name, value):
+    """
+    Changes the value of a setting stored in memorygain.db.
+    """
+    with database.get_connection() as connection:
+        connection.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (name, f'{value}'))
@@ -1,91 +1,460 @@
 """
-This module is for accessing and manipulating correct_dates_1440.txt, and again_dates_1440.txt.
-The 1440 is to indicate that they are only for recording results for cards that had an interval of 1440 or more.
+This module is for accessing and manipulating reviews_1440.csv, which has the number of correct and again answers given
+each day. The 1440 is to indicate that they are only for recording results for cards that had an interval of 1440 or
+more.
 """
 
 import tempfile
 import os
 import csv
+import io
+import collections
 import datetime
+import bisect
+import database
+import writer
+import cards
+import review_log
 
 
 temp_path = tempfile.gettempdir()
+review_fields = ['Date', 'Correct', 'Again']
+# Set by load_daily_results(). Maps each date (YYYY-mm-dd) to a list of [correct, again] for that day.
+daily_results = None
+# The totals of every day's results, as [correct, again].
+total_results = None
+# Where the last row of reviews_1440.csv starts (in bytes), and its date. The last row is the only one that changes, so
+# it is rewritten in place rather than rewriting the file.
+last_row_offset = 0
+last_row_date = None
+# Maps each number of days retention has been asked for (or None for every day) to its RetentionWindow.
+retention_windows = {}
+# Maps 'day', 'week' and 'month' to its RetentionSeries, once it has been asked for.
+retention_series = {}
+# The results writer's own connection to memorygain.db (a connection can only be used by the thread that opened it).
+writer_connection = None
 
 
 def stats_on_device():
     """
-    Checks if files related to statistics are on the device, if not they are added. decks.decks_on_device() must be called first to make
-    the MemoryGain dir.
+    Checks if files related to statistics are on the device, if not they are added. decks.decks_on_device() must be
+    called first to make the MemoryGain dir. Any correct_dates_1440.txt and again_dates_1440.txt (used before the
+    results were counted by day) are migrated into reviews_1440.csv.
     """
-    correct_dates_found = os.path.exists(f'{temp_path}\\..\\MemoryGain\\correct_dates_1440.txt')
-    again_dates_found = os.path.exists(f'{temp_path}\\..\\MemoryGain\\again_dates_1440.txt')
+    global daily_results
 
-    if not correct_dates_found:
-        with open(f'{temp_path}\\..\\MemoryGain\\correct_dates_1440.txt', 'w') as correct_dates_1440_file:
-            correct_dates_1440_file.write('')
+    # Results still being written belong to the files about to be read (or replaced).
+    flush()
 
-    if not again_dates_found:
-        with open(f'{temp_path}\\..\\MemoryGain\\again_dates_1440.txt', 'w') as again_dates_1440_file:
-            again_dates_1440_file.write('')
+    if os.path.exists(f'{temp_path}\\..\\MemoryGain\\correct_dates_1440.txt') or \
+            os.path.exists(f'{temp_path}\\..\\MemoryGain\\again_dates_1440.txt'):
+        migrate_dates_files()
+
+    elif not os.path.exists(f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv'):
+        write_daily_results({})
+
+    # Read again when next needed, in case the files have been replaced (e.g. by restoring a backup).
+    daily_results = None
+    retention_windows.clear()
+    retention_series.clear()
+
+
+def read_dates_files():
+    """
+    Returns a dict of date: [correct, again] counted from correct_dates_1440.txt and again_dates_1440.txt (which have a
+    line with the date of each result).
+    """
+    results = {}
+
+    for index, result in enumerate(('correct', 'again')):
+        if not os.path.exists(f'{temp_path}\\..\\MemoryGain\\{result}_dates_1440.txt'):
+            continue
+
+        with open(f'{temp_path}\\..\\MemoryGain\\{result}_dates_1440.txt', 'r') as dates_file:
+            counts = collections.Counter(line.strip() for line in dates_file if line.strip())
+
+        for date, count in counts.items():
+            results.setdefault(date, [0, 0])[index] = count
+
+    return results
+
+
+def migrate_dates_files():
+    """
+    Replaces reviews_1440.csv with the results counted from correct_dates_1440.txt and again_dates_1440.txt, and then
+    deletes them. If they are on the device they are the latest results (either they have not been migrated yet, or a
+    backup made before they were migrated has been restored).
+    """
+    write_daily_results(read_dates_files())
+
+    for result in ('correct', 'again'):
+        if os.path.exists(f'{temp_path}\\..\\MemoryGain\\{result}_dates_1440.txt'):
+            os.remove(f'{temp_path}\\..\\MemoryGain\\{result}_dates_1440.txt')
+
+
+def encode_row(row):
+    """
+    Returns a row of reviews_1440.csv as bytes.
+    """
+    row_file = io.StringIO()
+    csv.writer(row_file).writerow(row)
+
+    return row_file.getvalue().encode()
+
+
+def write_daily_results(results):
+    """
+    Rewrites reviews_1440.csv from a dict of date: [correct, again], in date order.
+    """
+    global last_row_offset, last_row_date
+
+    # Written under a temporary name first, so a failed write does not lose the results.
+    with open(f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv.tmp', 'wb') as reviews_file:
+        reviews_file.write(encode_row(review_fields))
+        last_row_offset = reviews_file.tell()
+        last_row_date = None
+
+        for date in sorted(results):
+            last_row_offset = reviews_file.tell()
+            last_row_date = date
+            reviews_file.write(encode_row([date] + results[date]))
+
+    os.replace(f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv.tmp', f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv')
+
+
+def load_daily_results():
+    """
+    Reads reviews_1440.csv into daily_results (and total_results), if it has not been read already.
+    """
+    global daily_results, total_results, last_row_offset, last_row_date
+
+    if daily_results is not None:
+        return
+
+    flush()
+    daily_results = {}
+    last_row_offset = 0
+    last_row_date = None
+
+    with open(f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv', 'rb') as reviews_file:
+        while True:
+            offset = reviews_file.tell()
+            line = reviews_file.readline()
+            if not line:
+                break
+
+            row = next(csv.reader([line.decode()]), None)
+            if row and row != review_fields and len(row) == 3:
+                daily_results[row[0]] = [int(row[1]), int(row[2])]
+                last_row_offset = offset
+                last_row_date = row[0]
+
+    total_results = [sum(results[0] for results in daily_results.values()),
+                     sum(results[1] for results in daily_results.values())]
+
+
+def add_result_1440(index):
+    """
+    Adds one to today's correct (index 0) or again (index 1) count. The count is changed in memory straight away, and
+    today's row of reviews_1440.csv is written by the results writer.
+    """
+    load_daily_results()
+    today = datetime.datetime.now().strftime('%Y-%m-%d')
+    today_results = daily_results.setdefault(today, [0, 0])
+    today_results[index] += 1
+    total_results[index] += 1
+
+    # A copy, as the list in daily_results keeps changing.
+    results_writer.put((today, index, list(today_results)))
+
+
+def write_results(results):
+    """
+    Run by the results writer thread. Writes a batch of (date, index, [correct, again] for the date) results, to
+    reviews_1440.csv or memorygain.db.
+    """
+    if database.database_in_use():
+        write_database_results(results)
+    else:
+        write_file_results(results)
+
+
+def write_file_results(results):
+    """
+    Writes the latest [correct, again] of each date in results to reviews_1440.csv. Normally only the last row (today's)
+    changes, so it is rewritten in place rather than rewriting the file.
+    """
+    global last_row_offset, last_row_date
+
+    latest_results = {date: date_results for date, index, date_results in results}
+
+    for date in sorted(latest_results):
+        if last_row_date is not None and date < last_row_date:
+            # The clock has gone back, so the date's row is not the last one.
+            with open(f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv', 'r', newline='') as reviews_file:
+                saved_results = {row[0]: [int(row[1]), int(row[2])] for row in csv.reader(reviews_file)
+                                 if len(row) == 3 and row != review_fields}
+            saved_results[date] = latest_results[date]
+            write_daily_results(saved_results)
+            continue
+
+        with open(f'{temp_path}\\..\\MemoryGain\\reviews_1440.csv', 'r+b') as reviews_file:
+            if date == last_row_date:
+                reviews_file.seek(last_row_offset)
+            else:
+                reviews_file.seek(0, os.SEEK_END)
+                last_row_offset = reviews_file.tell()
+                last_row_date = date
+
+            reviews_file.write(encode_row([date] + latest_results[date]))
+            reviews_file.truncate()
+
+
+def write_database_results(results):
+    """
+    Adds the results to the daily_reviews_1440 table of memorygain.db, in one transaction.
+    """
+    global writer_connection
+
+    if writer_connection is None:
+        writer_connection = database.connect()
+
+    counts = collections.Counter((date, index) for date, index, date_results in results)
+
+    with writer_connection:
+        writer_connection.executemany(
+            'INSERT INTO daily_reviews_1440 (Date, Correct, Again) VALUES (?, ?, ?) '
+            'ON CONFLICT (Date) DO UPDATE SET Correct = Correct + excluded.Correct, Again = Again + excluded.Again',
+            [(date, count, 0) if index == 0 else (date, 0, count) for (date, index), count in counts.items()]
+        )
+
+
+# Results are written in the background, so answering a card does not wait for the disk.
+results_writer = writer.BackgroundWriter(write_results)
+
+
+def flush():
+    """
+    Returns once every result added has been written to reviews_1440.csv (or memorygain.db).
+    """
+    results_writer.flush()
 
 
 def add_to_correct_1440():
     """
-    Adds a record to correct_dates_1440.txt.
+    Adds one to today's correct count.
     """
-    with open(f'{temp_path}\\..\\MemoryGain\\correct_dates_1440.txt', 'a') as correct_dates_1440:
-        correct_dates_1440.write(datetime.datetime.now().strftime('%Y-%m-%d') + '\n')
+    if database.database_in_use():
+        add_database_review_1440(0)
+    else:
+        add_result_1440(0)
+
+    for retention_window in retention_windows.values():
+        retention_window.add(0)
+    for series in retention_series.values():
+        series.add(0)
 
 
 def add_to_again_1440():
     """
-    Increments the 'Number Incorrect 1440 Minutes and Over' stat by 1.
+    Adds one to today's again count.
     """
-    with open(f'{temp_path}\\..\\MemoryGain\\again_dates_1440.txt', 'a') as correct_dates_1440:
-        correct_dates_1440.write(datetime.datetime.now().strftime('%Y-%m-%d') + '\n')
+    if database.database_in_use():
+        add_database_review_1440(1)
+    else:
+        add_result_1440(1)
 
+    for retention_window in retention_windows.values():
+        retention_window.add(1)
+    for series in retention_series.values():
+        series.add(1)
 
-def get_retention_1440(days=False):
+
+def get_results_between(first_date, last_date):
     """
-    Uses the records in correct_dates_1440.txt and again_dates_1440.txt to get the retention rate =
-    (correct / total * 100)%. The days parameter is used to specify how many days in the past from which to get the
-    results from, e.g. if days was 30 it would get the retention rate for the last 30 days. Returns
-    correct / total * 100 or False if the total cards is 0.
+    Returns [correct, again] for the results from first_date to last_date (datetime.dates, both included). If
+    first_date is None, every result up to last_date is included.
     """
-    if type(days) == bool:
-        with open(f'{temp_path}\\..\\MemoryGain\\correct_dates_1440.txt', 'r') as correct_dates_1440:
-            correct_dates_1440_lines = correct_dates_1440.readlines()
-            correct = len(correct_dates_1440_lines)
+    if database.database_in_use():
+        return get_database_results_between(first_date, last_date)
 
-        with open(f'{temp_path}\\..\\MemoryGain\\again_dates_1440.txt', 'r') as again_dates_1440:
-            again_dates_1440_lines = again_dates_1440.readlines()
-            total = correct + len(again_dates_1440_lines)
-    else:
-        cut_off_date = str((datetime.datetime.now() - datetime.timedelta(days)).strftime('%Y-%m-%d'))
+    load_daily_results()
+
+    if first_date is None:
+        return list(total_results)
+
+    results = [0, 0]
+    for day in range((last_date - first_date).days + 1):
+        day_results = daily_results.get((first_date + datetime.timedelta(day)).strftime('%Y-%m-%d'))
+        if day_results is not None:
+            results[0] += day_results[0]
+            results[1] += day_results[1]
+
+    return results
+
+
+class RetentionWindow:
+    """
+    The correct and again totals of the last days days (including today), or of every day if days is None. They are
+    kept up to date as results are added, so the retention rate is not counted again after every answer. When the date
+    changes, the days that have left the window are taken off and the new days are added (unless the window has moved
+    past all of its days, in which case it is counted again).
+    """
+
+    def __init__(self, days):
+        self.days = days
+        # The day the totals are up to date for.
+        self.last_date = None
+        self.results = [0, 0]
+
+    def get_results(self):
+        """
+        Returns [correct, again] for the window ending today.
+        """
+        today = datetime.date.today()
 
-        with open(f'{temp_path}\\..\\MemoryGain\\correct_dates_1440.txt', 'r') as correct_dates_1440:
-            correct_dates_1440_lines = correct_dates_1440.readlines()
-            correct_dates_after_cut_off = []
+        if self.days is None:
+            if self.last_date is None:
+                self.results = get_results_between(None, today)
 
-            for line in correct_dates_1440_lines:
-                line = line.replace('\n', '')
+        elif self.last_date is None or not (0 <= (today - self.last_date).days < self.days):
+            self.results = get_results_between(today - datetime.timedelta(self.days - 1), today)
 
-                if line > cut_off_date:
-                    correct_dates_after_cut_off.append(line)
+        elif today != self.last_date:
+            added = get_results_between(self.last_date + datetime.timedelta(1), today)
+            removed = get_results_between(self.last_date - datetime.timedelta(self.days - 1),
+                                          today - datetime.timedelta(self.days))
+            self.results = [self.results[index] + added[index] - removed[index] for index in range(2)]
 
-            correct = len(correct_dates_after_cut_off)
+        self.last_date = today
 
-        with open(f'{temp_path}\\..\\MemoryGain\\again_dates_1440.txt', 'r') as again_dates_1440:
-            again_dates_1440_lines = again_dates_1440.readlines()
-            again_dates_after_cut_off = []
+        return self.results
 
-            for line in again_dates_1440_lines:
-                line = line.replace('\n', '')
+    def add(self, index):
+        """
+        Adds a correct (index 0) or again (index 1) result given today, which has already been saved.
+        """
+        if self.days is None or 0 <= (self.last_date - datetime.date.today()).days < self.days:
+            self.results[index] += 1
+        # Otherwise today is not in the window. If the window is behind, the result is counted when it next moves up to
+        # today.
 
-                if line > cut_off_date:
-                    again_dates_after_cut_off.append(line)
 
-            total = correct + len(again_dates_after_cut_off)
+def get_all_daily_results():
+    """
+    Returns a dict of date (YYYY-mm-dd): [correct, again] for every day with results.
+    """
+    if database.database_in_use():
+        flush()
+        rows = database.get_connection().execute('SELECT Date, Correct, Again FROM daily_reviews_1440').fetchall()
+        return {date: [correct, again] for date, correct, again in rows}
+
+    load_daily_results()
+
+    return daily_results
+
+
+class RetentionSeries:
+    """
+    The correct and again totals of each day, week (starting on Monday) or month with results, so retention can be
+    charted over any range without counting the daily results again. The totals are counted from the daily results
+    the first time they are needed, and then kept up to date as results are added. Each bucket is keyed by the date it
+    starts on, and the keys are kept sorted so a range is found with a binary search.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.results = None
+        self.starts = []
+
+    def get_start(self, date):
+        """
+        Returns the first day of the bucket date (a datetime.date) is in.
+        """
+        if self.period == 'week':
+            return date - datetime.timedelta(date.weekday())
+        if self.period == 'month':
+            return date.replace(day=1)
+
+        return date
+
+    def add_to_bucket(self, date, results):
+        """
+        Adds [correct, again] results given on date to its bucket.
+        """
+        start = self.get_start(date)
+
+        if start not in self.results:
+            self.results[start] = [0, 0]
+            # Normally the newest bucket, so it goes on the end.
+            bisect.insort(self.starts, start)
+
+        self.results[start][0] += results[0]
+        self.results[start][1] += results[1]
+
+    def load(self):
+        """
+        Counts the buckets from the daily results, if they have not been counted already.
+        """
+        if self.results is not None:
+            return
+
+        self.results = {}
+        self.starts = []
+        for date, results in get_all_daily_results().items():
+            self.add_to_bucket(datetime.datetime.strptime(date, '%Y-%m-%d').date(), results)
+
+    def add(self, index):
+        """
+        Adds a correct (index 0) or again (index 1) result given today, which has already been saved.
+        """
+        # If the buckets have not been counted yet, the result is included when they are.
+        if self.results is not None:
+            self.add_to_bucket(datetime.date.today(), [1, 0] if index == 0 else [0, 1])
+
+    def get_results(self, first_date=None, last_date=None):
+        """
+        Returns a list of (start date, correct, again) for the buckets with results that include any day from
+        first_date to last_date (datetime.dates, or None for no limit), in date order.
+        """
+        self.load()
+
+        first = 0 if first_date is None else bisect.bisect_left(self.starts, self.get_start(first_date))
+        last = len(self.starts) if last_date is None else bisect.bisect_right(self.starts, last_date)
+
+        return [(start, *self.results[start]) for start in self.starts[first:last]]
+
+
+def get_retention_series(period='day', first_date=None, last_date=None):
+    """
+    Returns a list of (start date, retention rate) for each day, week or month (period is 'day', 'week' or 'month')
+    with results, from the one including first_date to the one including last_date (datetime.dates, or None for no
+    limit). Periods without any results are left out. The retention rate is False if a period has no answers.
+    """
+    if period not in retention_series:
+        retention_series[period] = RetentionSeries(period)
+
+    return [(start, float(correct / (correct + again) * 100) if correct + again else False)
+            for start, correct, again in retention_series[period].get_results(first_date, last_date)]
+
+
+def get_retention_1440(days=False):
+    """
+    Uses the daily results to get the retention rate = (correct / total * 100)%. The days parameter is used to specify
+    how many days in the past from which to get the results from, e.g. if days was 30 it would get the retention rate
+    for the last 30 days. Returns correct / total * 100 or False if the total cards is 0.
+
+    The totals for each window are kept in retention_windows, so this does not get slower as more results are
+    recorded.
+    """
+    if type(days) == bool:
+        days = None
+
+    if days not in retention_windows:
+        retention_windows[days] = RetentionWindow(days)
+
+    correct, again = retention_windows[days].get_results()
+    total = correct + again
 
     if total == 0:
         return False
@@ -93,8 +462,96 @@ def get_retention_1440(days=False):
     return float(correct / total * 100)
 
 
+def get_grouped_results(first_time=None, last_time=None, min_interval=0):
+    """
+    Returns a dict of (deck, phase): [correct, again] for the answers recorded in review_log.bin from first_time up to
+    (but not including) last_time, which are timestamps (or None for no limit). Each answer is counted under the deck
+    the card is in now (None if it has been deleted) and the phase it was in when it was answered. Only answers to
+    cards whose interval was at least min_interval at the time are counted (1440 counts the same answers as
+    reviews_1440.csv, though then there are no again phases, as cards in them have shorter intervals).
+
+    Only the records in the window are read, in one pass.
+    """
+    store = cards.get_card_store()
+    start = 0 if first_time is None else review_log.find_first_record(first_time)
+    results = {}
+
+    for card_id, timestamp, grade, phase, previous_interval, interval, ease, latency in review_log.iter_records(start):
+        if last_time is not None and timestamp >= last_time:
+            break
+        if previous_interval < min_interval:
+            continue
+
+        card = store.cards.get(card_id)
+        group_results = results.setdefault((card.deck if card is not None else None, phase), [0, 0])
+        group_results[0 if grade == 'correct' else 1] += 1
+
+    return results
+
+
+def get_window_start(days=False):
+    """
+    Returns the timestamp of the start of the last days days (including today), or None if days is False (for every
+    answer), to pass to get_grouped_results() as first_time.
+    """
+    if type(days) == bool:
+        return None
+
+    first_day = datetime.date.today() - datetime.timedelta(days - 1)
+
+    return datetime.datetime.combine(first_day, datetime.time()).timestamp()
+
+
+def group_retention(grouped_results, group_by=('deck', 'phase')):
+    """
+    Returns a dict of group: retention rate (correct / total * 100, or False if there were no answers) from the results
+    returned by get_grouped_results(). group_by is the fields the answers are grouped by, 'deck' and/or 'phase', and
+    each group is a tuple of their values in the same order (e.g. ('French', 'again 1')). The same results can be
+    grouped in several ways without reading review_log.bin again.
+    """
+    fields = ('deck', 'phase')
+    totals = {}
+    for key, results in grouped_results.items():
+        group = tuple(key[fields.index(field)] for field in group_by)
+        group_totals = totals.setdefault(group, [0, 0])
+        group_totals[0] += results[0]
+        group_totals[1] += results[1]
+
+    return {group: float(correct / (correct + again) * 100) if correct + again else False
+            for group, (correct, again) in totals.items()}
+
+
+def get_retention_table(days=False, group_by=('deck', 'phase'), min_interval=0):
+    """
+    Returns a dict of group: retention rate for the answers given in the last days days (including today), or every
+    answer if days is False. See group_retention() for group_by, and get_grouped_results() for min_interval.
+    """
+    return group_retention(get_grouped_results(get_window_start(days), min_interval=min_interval), group_by)
+
 
+def add_database_review_1440(index):
+    """
+    Adds one to today's Correct (index 0) or Again (index 1) count in memorygain.db, from the results writer.
+    """
+    results_writer.put((datetime.datetime.now().strftime('%Y-%m-%d'), index, None))
 
 
+def get_database_results_between(first_date, last_date):
+    """
+    Returns [correct, again] for the results recorded in memorygain.db from first_date to last_date (or up to
+    last_date, if first_date is None). Date is the primary key, so only the rows of the days asked for are read.
+    """
+    flush()
+
+    if first_date is None:
+        first_date = ''
+    else:
+        first_date = first_date.strftime('%Y-%m-%d')
 
+    correct, again = database.get_connection().execute(
+        'SELECT COALESCE(SUM(Correct), 0), COALESCE(SUM(Again), 0) FROM daily_reviews_1440 '
+        'WHERE Date >= ? AND Date <= ?',
+        (first_date, last_date.strftime('%Y-%m-%d'))
+    ).fetchone()
 
+    return [correct, again]
@@ -0,0 +1,157 @@
+"""
+Contains the study session, the queue of cards due today that the study screen shows one after another.
+"""
+
+import heapq
+import itertools
+import time
+import cards
+
+
+class StudySession:
+    """
+    Holds the cards due today in due date order, so the next card can be shown without looking through the card store
+    after every answer. There is one queue of every due card and one queue per deck, as the next card is taken from the
+    deck of the last card while it still has cards due (the same as cards.get_card()).
+
+    When a card is answered it is put back in the queues by its new due date if it is still due today (a card in the 3
+    and 10 minute learning steps), otherwise it leaves the session. Like the store's due heaps, entries are not removed
+    from the queues. Each card's latest entry is kept in self.latest, and any other entry is skipped when it reaches the
+    front of a queue.
+
+    The session is built from the card store when studying starts, so cards added or changed from other screens are
+    picked up the next time the study button is clicked.
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.deck_queues = {}
+        # Maps the ID of each card in the session to the order of its latest entry.
+        self.latest = {}
+        self.order = itertools.count()
+        self.due_cutoff = 0
+        # The card on screen, which has been taken out of the queues until it is answered, and when it was shown.
+        self.current_card_id = None
+        self.shown_time = None
+        self.build()
+
+    def build(self):
+        """
+        (Re)builds the queues from the cards the card store counts as due today.
+        """
+        store = cards.get_card_store()
+        self.due_cutoff = store.get_due_cutoff()
+        self.queue = []
+        self.deck_queues = {}
+        self.latest = {}
+
+        for card_id in store.due_today:
+            if card_id == self.current_card_id:
+                continue
+
+            card = store.cards[card_id]
+            entry = (card.due, next(self.order), card_id)
+            self.latest[card_id] = entry[1]
+            self.queue.append(entry)
+            self.deck_queues.setdefault(card.deck, []).append(entry)
+
+        heapq.heapify(self.queue)
+        for deck_queue in self.deck_queues.values():
+            heapq.heapify(deck_queue)
+
+    def push(self, card):
+        """
+        Puts an answered card back in the queues if it is due again today.
+        """
+        if card.due >= self.due_cutoff:
+            self.latest.pop(card.id, None)
+            return
+
+        entry = (card.due, next(self.order), card.id)
+        self.latest[card.id] = entry[1]
+        heapq.heappush(self.queue, entry)
+        heapq.heappush(self.deck_queues.setdefault(card.deck, []), entry)
+
+    def peek(self, deck=False):
+        """
+        Returns the next card in the session (only from deck, if deck is given), or None if there are no cards left.
+        """
+        store = cards.get_card_store()
+
+        if deck:
+            queue = self.deck_queues.get(deck, [])
+        else:
+            queue = self.queue
+
+        while queue:
+            due, order, card_id = queue[0]
+            card = store.cards.get(card_id)
+            # Skips old entries, and cards that have been deleted, rescheduled or moved to another deck since.
+            if card is not None and self.latest.get(card_id) == order and card.due == due and \
+                    ((not deck) or card.deck == deck):
+                return card
+            heapq.heappop(queue)
+
+        return None
+
+    def get_card(self, deck=False):
+        """
+        Returns False if no cards are due sometime today. Else it returns a copy of the next card, preferring cards in
+        deck (if given). The card's question and answer are normally already in memory from prefetch().
+        """
+        store = cards.get_card_store()
+
+        # Cards due tomorrow become due at midnight.
+        if store.get_due_cutoff() != self.due_cutoff:
+            self.build()
+
+        card = None
+        if deck:
+            card = self.peek(deck)
+        if card is None:
+            card = self.peek()
+        if card is None:
+            self.current_card_id = None
+            return False
+
+        # Taken out of the queues until it is answered.
+        del self.latest[card.id]
+        self.current_card_id = card.id
+        self.shown_time = time.monotonic()
+
+        store.load_body(card)
+        # A copy is returned so the caller cannot change the stored card.
+        return card.copy()
+
+    def prefetch(self, deck=False):
+        """
+        Loads the question and answer of the card that will be shown next (preferring deck, if given), so it can be
+        shown straight away. Called while the answer of the current card is on screen.
+        """
+        card = None
+        if deck:
+            card = self.peek(deck)
+        if card is None:
+            card = self.peek()
+
+        if card is not None:
+            cards.get_card_store().load_body(card)
+
+    def answer(self, current_card, correct):
+        """
+        Records the answer to the current card (correct is True for the correct button, False for again), and puts the
+        card back in the queues if it is due again today.
+        """
+        # Recorded in the review log, along with the answer.
+        latency = time.monotonic() - self.shown_time if self.shown_time is not None else None
+
+        if correct:
+            cards.correct_ans(current_card, latency)
+        else:
+            cards.again_ans(current_card, latency)
+
+        self.current_card_id = None
+
+        card = cards.get_card_store().cards.get(current_card.id)
+        if card is not None:
+            self.push(card)
@@ -0,0 +1,68 @@
+"""
+Contains the background writer, which saves changes in a separate thread so the window does not wait for the disk.
+"""
+
+import queue
+import threading
+
+
+class BackgroundWriter:
+    """
+    Saves items (e.g. the rows of answered cards) in a background thread. put() only adds the item to a queue, and the
+    thread passes everything that is waiting to write_batch in one call, so answers given while a write is still running
+    are saved together.
+
+    The queue holds at most max_pending items. If it is full, put() waits for the thread to catch up, so unsaved changes
+    cannot pile up without limit.
+
+    flush() waits until every item has been written, and must be called before anything else writes to the same files
+    (so changes are saved in the order they were made), and before the app closes or a backup is made. If write_batch
+    raised an error in the thread, it is raised again by flush().
+    """
+
+    def __init__(self, write_batch, max_pending=1000):
+        self.write_batch = write_batch
+        self.queue = queue.Queue(max_pending)
+        self.thread = None
+        self.error = None
+
+    def put(self, item):
+        """
+        Adds an item to be written by the background thread, starting the thread the first time it is needed.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+        self.queue.put(item)
+
+    def run(self):
+        """
+        Run by the background thread. Writes whatever is waiting in the queue, in batches, until the app closes.
+        """
+        while True:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.write_batch(items)
+            except Exception as error:
+                # Kept for flush() to raise, as nothing would see it in this thread.
+                self.error = error
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def flush(self):
+        """
+        Returns once every item that has been put has been written.
+        """
+        self.queue.join()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error